@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from django.urls import reverse
+from django.urls import path, reverse
 from django.utils import timezone
 from .models import Booking, Payment, DailyRoomPrice, ExchangeRate
 from rentals.models import Room
@@ -185,6 +188,46 @@ class DailyRoomPriceAdmin(HotelScopedAdmin):
     list_filter = ['room__hotel', 'date', 'currency', 'is_available']
     search_fields = ['room__name', 'room__hotel__name']
     ordering = ['room', 'date']
+    change_list_template = 'admin/bookings/dailyroomprice/change_list.html'
+    
+    def get_urls(self):
+        return [
+            path('import-kes/', self.admin_site.admin_view(self.import_kes_view), name='bookings_dailyroomprice_import_kes'),
+        ] + super().get_urls()
+    
+    def import_kes_view(self, request):
+        """Upload a KES rate sheet and import it row by row"""
+        from .forms import KesPriceImportForm
+        from .daily_prices import import_kes_prices
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = KesPriceImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            rooms = Room.objects.all()
+            if not (request.user.is_superuser or getattr(request.user, 'role', None) == 'super_admin'):
+                rooms = rooms.filter(hotel=request.user.hotel) if request.user.hotel_id else rooms.none()
+            # Stream the upload instead of reading it into memory, decoding line by line
+            # so a bad byte stops the import at its own line
+            lines = (line.decode('utf-8-sig') for line in form.cleaned_data['csv_file'])
+            try:
+                result = import_kes_prices(lines, rooms=rooms)
+            except ValueError as error:
+                form.add_error('csv_file', str(error))
+            else:
+                self.message_user(request, f"Imported {result.written} daily prices ({result.error_count} rows skipped).")
+                if result.stopped:
+                    self.message_user(request, f"{result.stopped}. {result.written} daily prices were imported before it.", level=messages.ERROR)
+                for line, message in result.errors[:20]:
+                    self.message_user(request, f"Line {line}: {message}", level=messages.WARNING)
+                if result.error_count > 20:
+                    self.message_user(request, f"... and {result.error_count - 20} more errors.", level=messages.WARNING)
+                return redirect('admin:bookings_dailyroomprice_changelist')
+        return TemplateResponse(request, 'admin/bookings/dailyroomprice/import_kes.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Import KES prices',
+            'opts': self.model._meta,
+            'form': form,
+        })
     
     def get_hotel(self, obj):
         return obj.room.hotel.name if obj.room and obj.room.hotel else "No Hotel"
@@ -0,0 +1,219 @@
+"""
+Room availability engine.
+
+Answers "which of these rooms are free for these nights" for a whole set of
+rooms at once instead of checking each room with its own query.
+
+Each room's blocked nights are kept as a bitmap in the configured Django
+cache: bit N is set when night `origin + N` is taken by a booking or blocked
+in RoomAvailability. The horizon starts on the first day of the current month
+and covers roughly two years, so a new month simply starts a fresh set of
+keys. Stays inside the horizon are answered with a bitmask AND; anything
+outside it falls back to SQL.
+
+Every room also has a version number that is part of its bitmap key. A
+change bumps the version instead of rewriting the bitmap, and builds are
+stored with cache.add under the version read before the database was
+queried. A build that raced with a change therefore lands under an old key
+nobody reads, and two changes can never overwrite each other's bits.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+
+from rentals.models import RoomAvailability
+from .models import Booking
+
+AVAILABILITY_HORIZON_DAYS = 732
+BITMAP_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
+
+
+def overlapping_bookings(room_ids, check_in, check_out):
+    """Return bookings that hold any of the given rooms for part of the stay"""
+    return Booking.objects.filter(
+        room_id__in=room_ids,
+        check_in_date__lt=check_out,
+        check_out_date__gt=check_in,
+        status__in=Booking.BLOCKING_STATUSES,
+    )
+
+
+def blocked_days(room_ids, check_in, check_out):
+    """Return RoomAvailability rows that block any of the given rooms during the stay"""
+    return RoomAvailability.objects.filter(
+        room_id__in=room_ids,
+        date__gte=check_in,
+        date__lt=check_out,
+        status__in=RoomAvailability.BLOCKING_STATUSES,
+    )
+
+
+def horizon_origin(today=None):
+    """Return the first night covered by the current bitmaps"""
+    from django.utils import timezone
+    today = today or timezone.localdate()
+    return today.replace(day=1)
+
+
+def _version_key(room_id):
+    return f"availability:version:{room_id}"
+
+
+def _bitmap_key(room_id, origin, version):
+    return f"availability:bitmap:{room_id}:{origin.isoformat()}:{version}"
+
+
+def _versions(room_ids):
+    """Return {room_id: current bitmap version}, starting any that are missing"""
+    keys = {_version_key(room_id): room_id for room_id in room_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for room_id in room_ids:
+        if room_id not in versions:
+            key = _version_key(room_id)
+            # A fresh start value never matches a bitmap stored before an eviction
+            cache.add(key, time.time_ns(), None)
+            versions[room_id] = cache.get(key)
+    return versions
+
+
+def _night_bits(origin, start, end):
+    """Return the bitmask for nights start..end, or None if they leave the horizon"""
+    offset = (start - origin).days
+    nights = (end - start).days
+    if offset < 0 or nights <= 0 or offset + nights > AVAILABILITY_HORIZON_DAYS:
+        return None
+    return ((1 << nights) - 1) << offset
+
+
+def _clip(origin, start, end):
+    """Clip a date range to the horizon, or return None if nothing is left"""
+    start = max(start, origin)
+    end = min(end, origin + timedelta(days=AVAILABILITY_HORIZON_DAYS))
+    if start >= end:
+        return None
+    return start, end
+
+
+def _load_bitmaps(room_ids, origin, start, end):
+    """Build the blocked-night bits for start..end from the database (two queries)"""
+    bitmaps = {room_id: 0 for room_id in room_ids}
+    stays = overlapping_bookings(room_ids, start, end).values_list(
+        'room_id', 'check_in_date', 'check_out_date'
+    )
+    for room_id, check_in, check_out in stays:
+        window = _clip(origin, max(check_in, start), min(check_out, end))
+        if window:
+            bitmaps[room_id] |= _night_bits(origin, *window)
+    for room_id, day in blocked_days(room_ids, start, end).values_list('room_id', 'date'):
+        bitmaps[room_id] |= 1 << (day - origin).days
+    return bitmaps
+
+
+def get_bitmaps(room_ids, origin=None):
+    """Return {room_id: bitmap}, building and caching any that are missing"""
+    origin = origin or horizon_origin()
+    # Versions are read before the database, so a change made meanwhile bumps past them
+    versions = _versions(room_ids)
+    keys = {_bitmap_key(room_id, origin, versions[room_id]): room_id for room_id in room_ids}
+    cached = cache.get_many(list(keys))
+    bitmaps = {keys[key]: bitmap for key, bitmap in cached.items()}
+
+    missing = [room_id for room_id in room_ids if room_id not in bitmaps]
+    if missing:
+        end = origin + timedelta(days=AVAILABILITY_HORIZON_DAYS)
+        built = _load_bitmaps(missing, origin, origin, end)
+        for room_id, bitmap in built.items():
+            cache.add(_bitmap_key(room_id, origin, versions[room_id]), bitmap, BITMAP_TIMEOUT)
+        bitmaps.update(built)
+    return bitmaps
+
+
+def refresh_nights(room_id, start, end):
+    """Retire the cached bitmap of one room whose nights start..end changed
+
+    The next lookup rebuilds it from the database under the new version.
+    """
+    if not _clip(horizon_origin(), start, end):
+        return
+    key = _version_key(room_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No version yet, so no bitmap either; start one that no build has used
+        if not cache.add(key, time.time_ns(), None):
+            cache.incr(key)
+
+
+def unavailable_room_ids(room_ids, check_in, check_out):
+    """Return the set of room ids that cannot be booked for the stay"""
+    room_ids = list(room_ids)
+    if not room_ids:
+        return set()
+    origin = horizon_origin()
+    stay = _night_bits(origin, check_in, check_out)
+    if stay is None:
+        taken = set(overlapping_bookings(room_ids, check_in, check_out).values_list('room_id', flat=True))
+        taken.update(blocked_days(room_ids, check_in, check_out).values_list('room_id', flat=True))
+        return taken
+    bitmaps = get_bitmaps(room_ids, origin)
+    return {room_id for room_id in room_ids if bitmaps[room_id] & stay}
+
+
+def unavailable_stays(stays):
+    """Return the positions of the (room_id, check_in, check_out) stays that cannot be booked
+
+    Stays inside the horizon share one bitmap lookup; the others are checked
+    with SQL, one query pair per distinct date range.
+    """
+    origin = horizon_origin()
+    taken = set()
+    inside, outside = [], {}
+    for position, (room_id, check_in, check_out) in enumerate(stays):
+        bits = _night_bits(origin, check_in, check_out)
+        if bits is None:
+            outside.setdefault((check_in, check_out), []).append((position, room_id))
+        else:
+            inside.append((position, room_id, bits))
+    if inside:
+        bitmaps = get_bitmaps({room_id for _, room_id, _ in inside}, origin)
+        taken.update(position for position, room_id, bits in inside if bitmaps[room_id] & bits)
+    for (check_in, check_out), positions in outside.items():
+        rooms_taken = unavailable_room_ids({room_id for _, room_id in positions}, check_in, check_out)
+        taken.update(position for position, room_id in positions if room_id in rooms_taken)
+    return taken
+
+
+def available_rooms(rooms, check_in, check_out):
+    """Return the rooms that are free for every night between check_in and check_out"""
+    rooms = list(rooms)
+    taken = unavailable_room_ids([room.id for room in rooms], check_in, check_out)
+    return [room for room in rooms if room.id not in taken]
+
+
+def blocked_night_matrix(room_ids, start, end):
+    """Return a (rooms x nights) boolean array that is True where a night is taken"""
+    room_ids = list(room_ids)
+    nights = (end - start).days
+    origin = horizon_origin()
+    if _night_bits(origin, start, end) is not None:
+        bitmaps = get_bitmaps(room_ids, origin)
+        offset = (start - origin).days
+        window = (1 << nights) - 1
+        size = (nights + 7) // 8
+        packed = np.frombuffer(b''.join(
+            ((bitmaps[room_id] >> offset) & window).to_bytes(size, 'little') for room_id in room_ids
+        ), dtype=np.uint8).reshape(len(room_ids), size)
+        return np.unpackbits(packed, axis=1, bitorder='little')[:, :nights].astype(bool)
+
+    matrix = np.zeros((len(room_ids), nights), dtype=bool)
+    row_of = {room_id: index for index, room_id in enumerate(room_ids)}
+    stays = overlapping_bookings(room_ids, start, end).values_list('room_id', 'check_in_date', 'check_out_date')
+    for room_id, check_in, check_out in stays:
+        first = max((check_in - start).days, 0)
+        last = min((check_out - start).days, nights)
+        matrix[row_of[room_id], first:last] = True
+    for room_id, day in blocked_days(room_ids, start, end).values_list('room_id', 'date'):
+        matrix[row_of[room_id], (day - start).days] = True
+    return matrix
@@ -0,0 +1,90 @@
+"""
+Fees and taxes on top of a stay's room subtotal.
+
+- A RoomFee is a flat amount per stay, or a percentage of the room subtotal
+  when `is_percentage` is set. Optional fees (`is_mandatory=False`) are listed
+  in the breakdown but not charged.
+- A RoomTax `rate` is a percentage of the room subtotal plus the mandatory
+  fees. An inclusive tax is already part of the prices: its share is shown in
+  the breakdown but not added again.
+
+Every line is rounded to the cent. All amounts are in the room's currency.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import prefetch_related_objects
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+# One fee or tax of a stay. `rate` is the percentage for percentage fees and
+# taxes, None for flat fees. `charged` is False for optional fees and
+# inclusive taxes, whose amount is not added to the total.
+ChargeLine = namedtuple('ChargeLine', ['kind', 'name', 'amount', 'rate', 'charged'])
+
+
+class Charges(namedtuple('Charges', ['subtotal', 'fee_amount', 'tax_amount', 'total', 'lines'])):
+    """The fees and taxes of one stay"""
+
+    def breakdown(self):
+        """Return the lines as JSON-friendly dicts"""
+        return [
+            {
+                'type': line.kind,
+                'name': line.name,
+                'amount': float(line.amount),
+                'rate': float(line.rate) if line.rate is not None else None,
+                'charged': line.charged,
+            }
+            for line in self.lines
+        ]
+
+
+def _cents(amount):
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def compute_charges(subtotal, fees, taxes):
+    """Apply the fees and taxes of one room to a room subtotal"""
+    subtotal = Decimal(subtotal)
+    lines = []
+    fee_amount = Decimal('0.00')
+    for fee in fees:
+        if fee.is_percentage:
+            amount = _cents(subtotal * fee.amount / HUNDRED)
+            rate = fee.amount
+        else:
+            amount = _cents(fee.amount)
+            rate = None
+        lines.append(ChargeLine('fee', fee.name, amount, rate, fee.is_mandatory))
+        if fee.is_mandatory:
+            fee_amount += amount
+
+    taxable = subtotal + fee_amount
+    # Inclusive taxes share the gross amount between them
+    inclusive_rate = sum((tax.rate for tax in taxes if tax.is_inclusive), Decimal('0'))
+    tax_amount = Decimal('0.00')
+    for tax in taxes:
+        if tax.is_inclusive:
+            amount = _cents(taxable * tax.rate / (HUNDRED + inclusive_rate))
+        else:
+            amount = _cents(taxable * tax.rate / HUNDRED)
+            tax_amount += amount
+        lines.append(ChargeLine('tax', tax.name, amount, tax.rate, not tax.is_inclusive))
+
+    return Charges(subtotal, fee_amount, tax_amount, subtotal + fee_amount + tax_amount, lines)
+
+
+def room_charges(rooms, subtotals):
+    """Return {room_id: Charges} for rooms given {room_id: subtotal}
+
+    Fees and taxes of the whole batch are loaded with one query each, unless
+    they were already prefetched.
+    """
+    rooms = list(rooms)
+    prefetch_related_objects(rooms, 'fees', 'taxes')
+    return {
+        room.id: compute_charges(subtotals[room.id], room.fees.all(), room.taxes.all())
+        for room in rooms
+    }
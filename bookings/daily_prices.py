@@ -0,0 +1,184 @@
+"""
+Bulk DailyRoomPrice updates: a date range across many rooms, or a CSV import.
+
+Rows are upserted with bulk_create(update_conflicts=True) on the (room, date)
+unique constraint, in chunks. Bulk writes send no model signals, so the
+search caches and the nightly rate rebuild queue are updated here.
+"""
+import csv
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from rentals.models import Room
+from . import exchange
+from .models import DailyRoomPrice, NightlyRateRebuild
+from .pricing import compile_rates, date_range, from_cents
+
+DAILY_PRICE_BATCH_SIZE = 1000
+# Errors beyond this many are counted but not kept
+MAX_REPORTED_ERRORS = 1000
+
+# DailyRoomPrice.price holds at most 10 digits, 2 of them decimals
+MAX_PRICE = Decimal('100000000')
+
+# stopped: why the CSV could not be read to the end, or None
+ImportResult = namedtuple('ImportResult', ['written', 'errors', 'error_count', 'stopped'])
+
+
+def _upsert(rows):
+    """Upsert DailyRoomPrice rows and queue what they make stale"""
+    # Nights touched per room, as (first, night after the last)
+    ranges = {}
+    for row in rows:
+        first, end = ranges.get(row.room_id, (row.date, row.date))
+        ranges[row.room_id] = (min(first, row.date), max(end, row.date + timedelta(days=1)))
+    with transaction.atomic():
+        DailyRoomPrice.objects.bulk_create(
+            rows,
+            batch_size=DAILY_PRICE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['room', 'date'],
+            update_fields=['price', 'currency'],
+        )
+        NightlyRateRebuild.objects.bulk_create([
+            NightlyRateRebuild(room_id=room_id, start_date=start, end_date=end)
+            for room_id, (start, end) in ranges.items()
+        ])
+
+        def invalidate():
+            from rentals.cache import invalidate_rooms
+            invalidate_rooms(ranges)
+        transaction.on_commit(invalidate)
+
+
+def set_daily_prices(rooms, start, end, price=None, percent=None, currency=None):
+    """Set the daily price of rooms for every night from start up to (not including) end
+
+    Either `price` sets a fixed amount (in `currency`, or each room's own
+    currency), or `percent` changes each night's current effective rate by
+    that percentage (e.g. 10 or -15). Returns the number of rows written.
+    """
+    if (price is None) == (percent is None):
+        raise ValueError('Give either a price or a percent change.')
+    rooms = list(rooms)
+    if not rooms or start >= end:
+        return 0
+
+    rows = []
+    if price is not None:
+        price = Decimal(price).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        for room in rooms:
+            rows.extend(
+                DailyRoomPrice(room=room, date=day, price=price, currency=currency or room.currency)
+                for day in date_range(start, end)
+            )
+    else:
+        factor = (Decimal('100') + Decimal(percent)) / Decimal('100')
+        for room_id, rates in compile_rates(rooms, start, end).items():
+            rows.extend(
+                DailyRoomPrice(
+                    room_id=room_id,
+                    date=day,
+                    price=(from_cents(cents) * factor).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
+                    currency=rates.room.currency,
+                )
+                for day, cents in zip(date_range(start, end), rates.amounts)
+            )
+
+    _upsert(rows)
+    return len(rows)
+
+
+def import_kes_prices(lines, batch_size=DAILY_PRICE_BATCH_SIZE, rooms=None):
+    """Import daily prices from CSV lines with `room`, `date` and `kes_price` columns
+
+    `lines` is any iterable of text lines (an open file, an upload), read one
+    batch at a time so memory stays flat. KES prices are stored in USD at the
+    current exchange rate. Each batch is committed on its own; bad rows are
+    skipped and reported as (line number, message). When the lines cannot be
+    read further, the rows read so far are written and `stopped` says where.
+    `rooms` is an optional Room queryset limiting which rooms may be written.
+    """
+    rooms = Room.objects.all() if rooms is None else rooms
+    try:
+        exchange.get_rate('KES', 'USD')
+    except exchange.MissingExchangeRate:
+        raise ValueError('No KES to USD exchange rate is stored.')
+
+    reader = csv.DictReader(lines)
+    try:
+        fieldnames = reader.fieldnames
+    except csv.Error as error:
+        raise ValueError(f'Could not read the CSV header: {error}')
+    missing = {'room', 'date', 'kes_price'} - set(fieldnames or [])
+    if missing:
+        raise ValueError(f"Missing CSV column(s): {', '.join(sorted(missing))}")
+
+    written = 0
+    errors = []
+    error_count = 0
+
+    def report(line, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line, message))
+
+    def flush(batch):
+        nonlocal written
+        known = set(rooms.filter(id__in={room_id for _, room_id, _, _ in batch}).values_list('id', flat=True))
+        rows = {}
+        for line, room_id, day, price in batch:
+            if room_id not in known:
+                report(line, f'Room {room_id} not found.')
+                continue
+            # A later row for the same night wins
+            rows[(room_id, day)] = DailyRoomPrice(room_id=room_id, date=day, price=price, currency='USD')
+        if rows:
+            _upsert(list(rows.values()))
+            written += len(rows)
+
+    batch = []
+    line = 0
+    stopped = None
+    try:
+        for row in reader:
+            line = reader.line_num
+            try:
+                room_id = uuid.UUID((row['room'] or '').strip())
+            except ValueError:
+                report(line, f"Invalid room id {row['room']!r}.")
+                continue
+            try:
+                day = parse_date((row['date'] or '').strip())
+            except ValueError:
+                day = None
+            if not day:
+                report(line, f"Invalid date {row['date']!r}. Use YYYY-MM-DD.")
+                continue
+            try:
+                kes_price = Decimal((row['kes_price'] or '').strip().replace(',', ''))
+            except InvalidOperation:
+                kes_price = None
+            if kes_price is None or not kes_price.is_finite() or kes_price < 0:
+                report(line, f"Invalid KES price {row['kes_price']!r}.")
+                continue
+            price = exchange.convert(kes_price, 'KES', 'USD').quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            if price >= MAX_PRICE:
+                report(line, f"KES price {row['kes_price']!r} is too large.")
+                continue
+            batch.append((line, room_id, day, price))
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as error:
+        # The rows read before it are still written below
+        stopped = f'Could not read past line {line}: {error}'
+    if batch:
+        flush(batch)
+    return ImportResult(written, errors, error_count, stopped)
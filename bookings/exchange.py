@@ -0,0 +1,155 @@
+"""
+Exchange-rate service: every currency conversion in the app goes through here.
+
+An ExchangeRate stores how many units of from_currency buy one unit of
+to_currency, so an amount in from_currency is divided by the rate. The latest
+rate of every pair is loaded with one query and kept in process memory for
+EXCHANGE_RATE_TTL seconds. Saving or deleting an ExchangeRate writes a new
+change stamp to the shared cache; every process compares it with the stamp
+it loaded under (at most every EXCHANGE_RATE_CHECK_SECONDS) and reloads when
+they differ.
+
+A pair without a stored rate is answered from its inverse, or by
+triangulating through USD.
+"""
+import hashlib
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+
+from .models import ExchangeRate
+
+EXCHANGE_RATE_TTL = 60 * 5  # 5 minutes
+# How often the shared change stamp is read, so lookups in a loop stay in memory
+EXCHANGE_RATE_CHECK_SECONDS = 2
+PIVOT_CURRENCY = 'USD'
+CHANGED_KEY = 'exchange-rates:changed'
+
+_lock = threading.Lock()
+_rates = None
+_fingerprint = None
+_loaded_at = 0.0
+_loaded_stamp = None
+_checked_at = 0.0
+
+
+class MissingExchangeRate(LookupError):
+    """No stored or derivable rate between two currencies"""
+
+
+def _stale():
+    """Whether the loaded rates expired or another process changed a rate"""
+    global _checked_at
+    now = time.monotonic()
+    if _rates is None or now - _loaded_at > EXCHANGE_RATE_TTL:
+        return True
+    if now - _checked_at > EXCHANGE_RATE_CHECK_SECONDS:
+        _checked_at = now
+        return changed_at() != _loaded_stamp
+    return False
+
+
+def _latest_rates():
+    """Return {(from, to): rate} with the latest stored rate of each pair, loading it when stale"""
+    global _rates, _fingerprint, _loaded_at, _loaded_stamp, _checked_at
+    with _lock:
+        if _stale():
+            # Read the stamp first, so a change made during the load is seen next time
+            stamp = changed_at()
+            latest = ExchangeRate.objects.filter(
+                from_currency=OuterRef('from_currency'), to_currency=OuterRef('to_currency'),
+            ).order_by('-date', '-id').values('id')[:1]
+            stored = ExchangeRate.objects.filter(id=Subquery(latest)).order_by('-date', '-id').values_list(
+                'from_currency', 'to_currency', 'rate'
+            )
+            rates = {}
+            for from_currency, to_currency, rate in stored:
+                if rate:
+                    rates.setdefault((from_currency.upper(), to_currency.upper()), rate)
+            _rates = rates
+            _fingerprint = hashlib.md5(repr(sorted(rates.items())).encode()).hexdigest()
+            _loaded_at = _checked_at = time.monotonic()
+            _loaded_stamp = stamp
+        return _rates
+
+
+def fingerprint():
+    """Return a hash of the rates this process converts with, for ETags"""
+    _latest_rates()
+    return _fingerprint
+
+
+def changed_at():
+    """Return when an exchange rate last changed (epoch seconds), as far as the shared cache knows"""
+    changed = cache.get(CHANGED_KEY)
+    if changed is None:
+        cache.add(CHANGED_KEY, time.time(), None)
+        changed = cache.get(CHANGED_KEY)
+    return changed
+
+
+def invalidate():
+    """Forget the loaded rates so the next lookup reads them again"""
+    global _rates
+    with _lock:
+        _rates = None
+    cache.set(CHANGED_KEY, time.time(), None)
+
+
+def _pair_rate(rates, from_currency, to_currency):
+    if (from_currency, to_currency) in rates:
+        return rates[(from_currency, to_currency)]
+    if (to_currency, from_currency) in rates:
+        return 1 / rates[(to_currency, from_currency)]
+    return None
+
+
+def get_rate(from_currency, to_currency):
+    """Return how many units of from_currency buy one unit of to_currency
+
+    Raises MissingExchangeRate when no rate is stored or derivable.
+    """
+    from_currency, to_currency = from_currency.upper(), to_currency.upper()
+    if from_currency == to_currency:
+        return Decimal('1')
+    rates = _latest_rates()
+    rate = _pair_rate(rates, from_currency, to_currency)
+    if rate is None:
+        # Triangulate: (from per USD) / (to per USD) = from per to
+        from_pivot = _pair_rate(rates, from_currency, PIVOT_CURRENCY)
+        to_pivot = _pair_rate(rates, to_currency, PIVOT_CURRENCY)
+        if from_pivot is not None and to_pivot is not None:
+            rate = from_pivot / to_pivot
+    if rate is None:
+        raise MissingExchangeRate(f"No exchange rate from {from_currency} to {to_currency}")
+    return rate
+
+
+def convert(amount, from_currency, to_currency):
+    """Convert an amount between currencies (unrounded)
+
+    Raises MissingExchangeRate when no rate is stored or derivable.
+    """
+    if from_currency.upper() == to_currency.upper():
+        return amount
+    return Decimal(amount) / get_rate(from_currency, to_currency)
+
+
+def convert_cents(cents, from_currency, to_currency):
+    """Convert an array of integer cents, rounding each amount half up to the cent
+
+    The rate is applied as an exact fraction with integer arithmetic, so the
+    result matches Decimal conversion followed by ROUND_HALF_UP quantization.
+    Raises MissingExchangeRate when no rate is stored or derivable.
+    """
+    cents = np.asarray(cents, dtype=np.int64)
+    if from_currency.upper() == to_currency.upper():
+        return cents.copy()
+    numerator, denominator = get_rate(from_currency, to_currency).as_integer_ratio()
+    # cents / rate == cents * denominator / numerator; Python ints never overflow
+    scaled = cents.astype(object) * (2 * denominator) + numerator
+    return (scaled // (2 * numerator)).astype(np.int64)
@@ -0,0 +1,160 @@
+"""
+Streaming exports of bookings and payments, as CSV or NDJSON.
+
+Rows are read with .iterator(chunk_size=EXPORT_CHUNK_SIZE) and written out
+one chunk at a time, so memory stays flat however many rows a hotel has.
+Hotel, room and guest come in the same query through select_related. On
+PostgreSQL the iterator uses a server-side cursor.
+
+Bookings are filtered on their check-in date, payments on the day they
+were created; both ranges include the end date.
+"""
+import csv
+import json
+from collections import namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Booking, Payment
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# One exportable model: its queryset, the date field ranges filter on, the
+# hotel lookup and the (column, attribute path) pairs written per row
+Export = namedtuple('Export', ['queryset', 'date_lookup', 'hotel_lookup', 'columns'])
+
+EXPORTS = {
+    'bookings': Export(
+        lambda: Booking.objects.select_related('hotel', 'room', 'guest'),
+        'check_in_date',
+        'hotel',
+        [
+            ('booking_reference', 'booking_reference'),
+            ('status', 'status'),
+            ('source', 'source'),
+            ('hotel', 'hotel.name'),
+            ('room', 'room.name'),
+            ('guest_name', 'guest_name'),
+            ('guest_email', 'guest_email'),
+            ('guest_phone', 'guest_phone'),
+            ('guest_account', 'guest.email'),
+            ('check_in_date', 'check_in_date'),
+            ('check_out_date', 'check_out_date'),
+            ('nights', 'nights'),
+            ('adults', 'adults'),
+            ('children', 'children'),
+            ('infants', 'infants'),
+            ('currency', 'currency'),
+            ('room_rate', 'room_rate'),
+            ('subtotal', 'subtotal'),
+            ('fee_amount', 'fee_amount'),
+            ('tax_amount', 'tax_amount'),
+            ('discount_amount', 'discount_amount'),
+            ('total_amount', 'total_amount'),
+            ('created_at', 'created_at'),
+            ('confirmed_at', 'confirmed_at'),
+            ('cancelled_at', 'cancelled_at'),
+        ],
+    ),
+    'payments': Export(
+        lambda: Payment.objects.select_related('booking__hotel', 'booking__room', 'booking__guest', 'user'),
+        'created_at__date',
+        'booking__hotel',
+        [
+            ('payment_id', 'id'),
+            ('booking_reference', 'booking.booking_reference'),
+            ('hotel', 'booking.hotel.name'),
+            ('room', 'booking.room.name'),
+            ('guest_name', 'booking.guest_name'),
+            ('guest_account', 'booking.guest.email'),
+            ('paid_by', 'user.email'),
+            ('status', 'status'),
+            ('payment_method', 'payment_method'),
+            ('currency', 'currency'),
+            ('amount', 'amount'),
+            ('transaction_id', 'transaction_id'),
+            ('reference_number', 'reference_number'),
+            ('created_at', 'created_at'),
+            ('processed_at', 'processed_at'),
+        ],
+    ),
+}
+
+
+def _value(obj, path):
+    """Follow a dotted attribute path, stopping at an empty relation"""
+    for name in path.split('.'):
+        obj = getattr(obj, name)
+        if obj is None:
+            return None
+    return obj
+
+
+def export_queryset(kind, hotels=None, start_date=None, end_date=None, statuses=None):
+    """Return the filtered, ordered rows of one export
+
+    `hotels` is an optional Hotel queryset (or list) limiting whose rows are
+    exported; `statuses` an optional list of statuses.
+    """
+    export = EXPORTS[kind]
+    # Only the exported columns are loaded, also from the related rows
+    rows = export.queryset().only(*(path.replace('.', '__') for _, path in export.columns))
+    if hotels is not None:
+        rows = rows.filter(**{f'{export.hotel_lookup}__in': hotels})
+    if start_date:
+        rows = rows.filter(**{f'{export.date_lookup}__gte': start_date})
+    if end_date:
+        rows = rows.filter(**{f'{export.date_lookup}__lte': end_date})
+    if statuses:
+        rows = rows.filter(status__in=statuses)
+    # Oldest first, with the primary key to keep the order stable
+    return rows.order_by(export.date_lookup.replace('__date', ''), 'pk')
+
+
+class _Buffer:
+    """Collects written rows so they can be yielded in chunks"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text)
+
+    def take(self):
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+
+def export_chunks(kind, rows, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield an export as text chunks of about chunk_size rows each"""
+    columns = EXPORTS[kind].columns
+    if export_format == 'csv':
+        buffer = _Buffer()
+        writer = csv.writer(buffer)
+        writer.writerow([name for name, _ in columns])
+
+        def write(row):
+            writer.writerow(['' if value is None else value for value in row])
+    elif export_format == 'ndjson':
+        buffer = _Buffer()
+        names = [name for name, _ in columns]
+
+        def write(row):
+            buffer.write(json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder, separators=(',', ':')) + '\n')
+    else:
+        raise ValueError(f"Unknown export format {export_format!r}. Use {' or '.join(EXPORT_FORMATS)}.")
+
+    count = 0
+    for obj in rows.iterator(chunk_size=chunk_size):
+        write([_value(obj, path) for _, path in columns])
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.take()
+    tail = buffer.take()
+    if tail:
+        yield tail
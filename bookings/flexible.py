@@ -0,0 +1,59 @@
+"""
+Flexible-date search: the cheapest check-in dates for a stay of N nights.
+
+Prices and taken nights for every room in the window are loaded in bulk into
+(rooms x nights) arrays. Each room's stay totals then come from one
+sliding-window sum over the cumulative price array. A window that contains a
+taken night is masked out, using the same overlap rules as regular searches.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from .availability import blocked_night_matrix
+from .pricing import nightly_price_matrix, from_cents
+
+
+def cheapest_stays(rooms, start, end, nights, limit=3):
+    """Return the `limit` cheapest valid stays of `nights` nights per room inside start..end"""
+    rooms = list(rooms)
+    days = (end - start).days
+    if not rooms or nights > days:
+        return []
+
+    prices = nightly_price_matrix(rooms, start, end)
+    taken = blocked_night_matrix([room.id for room in rooms], start, end)
+
+    zero = np.zeros((len(rooms), 1), dtype=np.int64)
+    price_sums = np.hstack([zero, np.cumsum(prices, axis=1)])
+    taken_sums = np.hstack([zero, np.cumsum(taken, axis=1, dtype=np.int64)])
+    # totals[r, d] is the price of checking into room r on start + d
+    totals = price_sums[:, nights:] - price_sums[:, :-nights]
+    valid = (taken_sums[:, nights:] - taken_sums[:, :-nights]) == 0
+
+    # Respect each room's stay length limits
+    fits = np.array([
+        room.min_stay <= nights and (not room.max_stay or nights <= room.max_stay) for room in rooms
+    ])
+    valid &= fits[:, None]
+
+    results = []
+    for index, room in enumerate(rooms):
+        offsets = np.flatnonzero(valid[index])
+        if not offsets.size:
+            continue
+        # Stable sort keeps earlier check-in dates first among equal prices
+        best = offsets[np.argsort(totals[index, offsets], kind='stable')[:limit]]
+        results.append({
+            'room': room,
+            'stays': [
+                {
+                    'checkin': start + timedelta(days=int(offset)),
+                    'checkout': start + timedelta(days=int(offset) + nights),
+                    'total_price': from_cents(totals[index, offset]),
+                }
+                for offset in best
+            ],
+        })
+    results.sort(key=lambda result: result['stays'][0]['total_price'])
+    return results
@@ -1,17 +1,20 @@
 from decimal import Decimal, ROUND_HALF_UP
 from django import forms
 from .models import DailyRoomPrice
+from . import exchange
 
 class DailyRoomPriceForm(forms.ModelForm):
     kes_price = forms.DecimalField(
         label='Price (KES)', required=False, help_text='Enter price in KES (auto-converts to USD)')
+    rate_used = forms.DecimalField(
+        label='KES to USD Rate Used', required=False, help_text='Exchange rate used for conversion.',
+        widget=forms.NumberInput(attrs={'readonly': 'readonly'}))
 
     class Meta:
         model = DailyRoomPrice
-        fields = ['room', 'date', 'price', 'rate_used']
+        fields = ['room', 'date', 'price']
         widgets = {
             'price': forms.NumberInput(attrs={'readonly': 'readonly'}),
-            'rate_used': forms.NumberInput(attrs={'readonly': 'readonly'}),
         }
 
     def __init__(self, *args, **kwargs):
@@ -19,40 +22,60 @@ class DailyRoomPriceForm(forms.ModelForm):
         self.fields['price'].label = 'Price (USD)'
         self.fields['price'].help_text = 'Auto-calculated from KES using the current exchange rate.'
         self.fields['price'].required = False
-        self.fields['rate_used'].label = 'KES to USD Rate Used'
-        self.fields['rate_used'].help_text = 'Exchange rate used for conversion.'
-        self.fields['rate_used'].required = False
 
     def clean(self):
         cleaned_data = super().clean()
         kes_price = cleaned_data.get('kes_price')
         if kes_price:
-            room = cleaned_data.get('room')
-            if room:
-                rental = room.rental
-                try:
-                    rate = Decimal(str(rental.exchange_rate.rate))
-                except Exception:
-                    rate = Decimal('130')  # fallback default
-                usd = Decimal(str(kes_price)) / rate
-                cleaned_data['price'] = usd.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                cleaned_data['rate_used'] = rate.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
+            try:
+                rate = exchange.get_rate('KES', 'USD')
+                usd = exchange.convert(Decimal(str(kes_price)), 'KES', 'USD')
+            except exchange.MissingExchangeRate:
+                raise forms.ValidationError('No KES to USD exchange rate is stored. Add one under Exchange Rates first.')
+            cleaned_data['price'] = usd.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            cleaned_data['rate_used'] = rate.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
+        elif cleaned_data.get('price') is None:
+            self.add_error('price', 'Enter a price in KES to convert.')
         return cleaned_data
 
     def save(self, commit=True):
         instance = super().save(commit=False)
-        kes_price = self.cleaned_data.get('kes_price')
-        if kes_price:
-            room = self.cleaned_data.get('room')
-            if room:
-                rental = room.rental
-                try:
-                    rate = Decimal(str(rental.exchange_rate.rate))
-                except Exception:
-                    rate = Decimal('130')
-                usd = Decimal(str(kes_price)) / rate
-                instance.price = usd.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-                instance.rate_used = rate.quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP)
+        # Prices converted from KES are stored in USD
+        if self.cleaned_data.get('kes_price'):
+            instance.currency = 'USD'
         if commit:
             instance.save()
         return instance
+
+class DailyPriceRangeForm(forms.Form):
+    """Admin form for setting a price, or a percentage change, over a date range"""
+    MAX_NIGHTS = 366
+
+    start_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}), help_text='Last night to update (inclusive)')
+    price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False, help_text='Fixed nightly price')
+    currency = forms.CharField(min_length=3, max_length=3, required=False, help_text="Currency of the price (defaults to each room's currency)")
+    percent = forms.DecimalField(max_digits=6, decimal_places=2, min_value=-99, required=False, help_text='Or change current rates by this percentage, e.g. 10 or -15')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        price = cleaned_data.get('price')
+        percent = cleaned_data.get('percent')
+        if (price is None) == (percent is None):
+            raise forms.ValidationError('Give either a price or a percent change.')
+        if cleaned_data.get('currency'):
+            if percent is not None:
+                self.add_error('currency', "A percent change keeps each room's currency.")
+            cleaned_data['currency'] = cleaned_data['currency'].upper()
+        start, end = cleaned_data.get('start_date'), cleaned_data.get('end_date')
+        if start and end:
+            nights = (end - start).days + 1
+            if nights < 1:
+                self.add_error('end_date', 'End date must not be before start date.')
+            elif nights > self.MAX_NIGHTS:
+                self.add_error('end_date', f'The range can be at most {self.MAX_NIGHTS} nights.')
+        return cleaned_data
+
+class KesPriceImportForm(forms.Form):
+    """Admin upload of a CSV rate sheet in KES"""
+    csv_file = forms.FileField(label='CSV file', help_text='Columns: room (id), date (YYYY-MM-DD), kes_price')
@@ -0,0 +1,141 @@
+"""
+Room-night holds: double-booking protection without a global lock.
+
+Every night of a booking is written as a RoomNightHold row, unique per room
+and night, in the same transaction as the booking. When two checkouts race
+for the same night, the database lets only one insert commit and the other
+gets a RoomUnavailable. Bookings for different rooms or nights never touch
+the same rows, so they proceed in parallel.
+
+Holds of a pending booking expire after BOOKING_HOLD_MINUTES. An expired
+hold is released the next time someone asks for the night (or by the
+sweeper), and its unpaid booking is cancelled. A completed payment or a
+confirmed booking keeps its holds for good.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .availability import overlapping_bookings, blocked_days
+from .models import Booking, RoomNightHold
+from .pricing import date_range
+
+
+RELEASE_BATCH_SIZE = 500
+
+
+def hold_ttl():
+    return timedelta(minutes=getattr(settings, 'BOOKING_HOLD_MINUTES', 15))
+
+
+class RoomUnavailable(Exception):
+    """Another booking or a block already holds some of the nights"""
+
+
+def release_expired(room_id=None, start=None, end=None, now=None, batch_size=RELEASE_BATCH_SIZE):
+    """Release expired holds (of one room and date range, or everywhere)
+
+    Pending bookings whose holds expired are cancelled. Bookings are locked
+    and handled batch_size at a time, each batch in its own transaction (or
+    savepoint, inside the caller's). Returns the number of bookings cancelled.
+    """
+    now = now or timezone.now()
+    expired = RoomNightHold.objects.filter(expires_at__lt=now)
+    if room_id:
+        expired = expired.filter(room_id=room_id)
+    if start and end:
+        expired = expired.filter(date__gte=start, date__lt=end)
+
+    cancelled = 0
+    while True:
+        with transaction.atomic():
+            booking_ids = list(expired.order_by('booking_id').values_list('booking_id', flat=True).distinct()[:batch_size])
+            if not booking_ids:
+                break
+            for booking in Booking.objects.select_for_update().filter(id__in=booking_ids):
+                if booking.status == 'pending':
+                    booking.status = 'cancelled'
+                    booking.cancelled_at = now
+                    booking.internal_notes = '\n'.join(filter(None, [booking.internal_notes, 'Hold expired before payment completed.']))
+                    # Saving releases the holds through the post_save signal
+                    booking.save(update_fields=['status', 'cancelled_at', 'internal_notes', 'updated_at'])
+                    cancelled += 1
+                elif booking.status in Booking.BLOCKING_STATUSES:
+                    confirm_holds(booking)
+                else:
+                    release_holds(booking)
+        # Every booking handled above no longer has expired holds
+        if len(booking_ids) < batch_size:
+            break
+    return cancelled
+
+
+def stay_conflict(booking, now=None):
+    """Return why the booking's room cannot be held for its nights, or None
+
+    Changes nothing. Bookings whose holds expired do not count, since holding
+    the nights releases them.
+    """
+    now = now or timezone.now()
+    check_in, check_out = booking.check_in_date, booking.check_out_date
+    # Bookings and blocks made without holds (admin, imports) count too
+    others = overlapping_bookings([booking.room_id], check_in, check_out).exclude(pk=booking.pk)
+    if others.exclude(holds__expires_at__lt=now).exists():
+        return 'The room is already booked for some of these nights.'
+    if blocked_days([booking.room_id], check_in, check_out).exists():
+        return 'The room is blocked for some of these nights.'
+    return None
+
+
+def _hold_nights(booking, expires_at, now):
+    """Insert holds for every night of a booking, or raise RoomUnavailable"""
+    check_in, check_out = booking.check_in_date, booking.check_out_date
+    release_expired(booking.room_id, check_in, check_out, now)
+    conflict = stay_conflict(booking, now)
+    if conflict:
+        raise RoomUnavailable(conflict)
+
+    try:
+        with transaction.atomic():
+            RoomNightHold.objects.bulk_create([
+                RoomNightHold(room_id=booking.room_id, date=night, booking=booking, expires_at=expires_at)
+                for night in date_range(check_in, check_out)
+            ])
+    except IntegrityError:
+        raise RoomUnavailable('The room is already booked for some of these nights.')
+
+
+def hold_booking(booking, ttl=None):
+    """Hold every night of a saved booking; call inside transaction.atomic()
+
+    Raises RoomUnavailable when another booking or a block has any of them.
+    """
+    now = timezone.now()
+    expires_at = now + (ttl or hold_ttl()) if booking.status == 'pending' else None
+    _hold_nights(booking, expires_at, now)
+    return expires_at
+
+
+def move_holds(booking):
+    """Hold a booking's current room and nights instead of the ones it held before
+
+    Called when a blocking booking's room or dates change, or when it blocks
+    its room again. Holds keep their expiry; a booking without holds gets
+    permanent ones, since it was not made through a checkout. Raises
+    RoomUnavailable when another booking or a block has any of the nights.
+    """
+    expires_at = RoomNightHold.objects.filter(booking=booking).values_list('expires_at', flat=True).first()
+    release_holds(booking)
+    _hold_nights(booking, expires_at, timezone.now())
+
+
+def confirm_holds(booking):
+    """Stop a booking's holds from expiring"""
+    RoomNightHold.objects.filter(booking=booking, expires_at__isnull=False).update(expires_at=None)
+
+
+def release_holds(booking):
+    """Free every night a booking holds"""
+    RoomNightHold.objects.filter(booking=booking).delete()
@@ -0,0 +1,308 @@
+"""
+Bulk booking import, for moving a property's history over from another PMS.
+
+Rows are read one batch at a time. Rooms (with their hotel and currency)
+are resolved from one lookup map built up front, the derived fields that
+Booking.save() would compute (nights, subtotal, total) are computed for the
+whole batch with numpy in integer cents, and each batch is written with
+bulk_create in its own transaction.
+
+bulk_create skips save() and the model signals, so this module keeps their
+invariants itself:
+
+- the hotel comes from the room and a missing reference is generated;
+  given references may not have the generated format, which later
+  generated references could repeat;
+- bookings that block their room (pending, confirmed, checked in) may not
+  overlap other such bookings or blocked days, and get permanent
+  room-night holds, so the database still refuses a double booking that
+  races the import;
+- the availability bitmaps and search caches of the rooms are refreshed
+  once the batch commits.
+
+Bad rows are skipped and reported as (line number, message). When the
+input itself cannot be read further (bad encoding, broken CSV), the rows
+read so far are still written and the import stops, saying where.
+"""
+import csv
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from rentals.models import Room
+from .availability import blocked_days, overlapping_bookings, refresh_nights
+from .models import Booking, RoomNightHold
+from .pricing import date_range, from_cents, to_cents
+from .references import is_generated_reference, next_booking_reference
+
+BOOKING_IMPORT_BATCH_SIZE = 1000
+# Errors beyond this many are counted but not kept
+MAX_REPORTED_ERRORS = 1000
+# Booking amounts hold at most 10 digits, 2 of them decimals
+MAX_CENTS = 10 ** 10
+
+REQUIRED_COLUMNS = {'room', 'check_in_date', 'check_out_date', 'guest_name', 'guest_email', 'guest_phone', 'room_rate'}
+AMOUNT_COLUMNS = ['room_rate', 'tax_amount', 'fee_amount', 'discount_amount']
+GUEST_COUNT_COLUMNS = {'adults': 1, 'children': 0, 'infants': 0}
+TEXT_COLUMNS = ['guest_name', 'guest_email', 'guest_phone', 'guest_address', 'guest_id_number', 'special_requests', 'internal_notes']
+STATUSES = {value for value, _ in Booking.STATUS_CHOICES}
+SOURCES = {value for value, _ in Booking.BOOKING_SOURCE}
+
+# stopped: why the input could not be read to the end, or None
+BookingImportResult = namedtuple('BookingImportResult', ['written', 'errors', 'error_count', 'seconds', 'stopped'])
+
+
+class RowError(ValueError):
+    """A row that cannot be imported"""
+
+
+def csv_rows(lines):
+    """Yield (line number, row) from CSV lines, checking the header first"""
+    reader = csv.DictReader(lines)
+    missing = REQUIRED_COLUMNS - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Missing CSV column(s): {', '.join(sorted(missing))}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _text(row, column):
+    value = row.get(column)
+    return '' if value is None else str(value).strip()
+
+
+def _amount(row, column):
+    text = _text(row, column).replace(',', '')
+    if not text:
+        return 0
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite() or amount < 0 or amount >= MAX_CENTS / 100:
+        raise RowError(f"Invalid {column} {row.get(column)!r}.")
+    return to_cents(amount)
+
+
+def _default_status(check_in, check_out, today):
+    """Status of a row without one: history is over, a stay that began is in progress"""
+    if check_out < today:
+        return 'checked_out'
+    if check_in < today:
+        return 'checked_in'
+    return 'confirmed'
+
+
+def _parse(row, rooms, today):
+    """Check one row and return its fields, with dates and amounts (in cents) parsed"""
+    try:
+        room_id = uuid.UUID(_text(row, 'room'))
+    except ValueError:
+        raise RowError(f"Invalid room id {row.get('room')!r}.")
+    if room_id not in rooms:
+        raise RowError(f'Room {room_id} not found.')
+
+    fields = {'room_id': room_id}
+    for column in ('check_in_date', 'check_out_date'):
+        try:
+            fields[column] = parse_date(_text(row, column))
+        except ValueError:
+            fields[column] = None
+        if not fields[column]:
+            raise RowError(f"Invalid {column} {row.get(column)!r}. Use YYYY-MM-DD.")
+    for column in AMOUNT_COLUMNS:
+        fields[column] = _amount(row, column)
+    for column, default in GUEST_COUNT_COLUMNS.items():
+        text = _text(row, column)
+        if not text:
+            fields[column] = default
+        elif text.isdigit():
+            fields[column] = int(text)
+        else:
+            raise RowError(f"Invalid {column} {row.get(column)!r}.")
+    for column in TEXT_COLUMNS:
+        fields[column] = _text(row, column)
+    for column in ('guest_name', 'guest_email', 'guest_phone'):
+        if not fields[column]:
+            raise RowError(f'{column} is required.')
+    try:
+        validate_email(fields['guest_email'])
+    except ValidationError:
+        raise RowError(f"Invalid guest_email {row.get('guest_email')!r}.")
+
+    fields['status'] = _text(row, 'status') or _default_status(fields['check_in_date'], fields['check_out_date'], today)
+    if fields['status'] not in STATUSES:
+        raise RowError(f"Invalid status {row.get('status')!r}.")
+    fields['source'] = _text(row, 'source') or 'other'
+    if fields['source'] not in SOURCES:
+        raise RowError(f"Invalid source {row.get('source')!r}.")
+    fields['currency'] = (_text(row, 'currency') or rooms[room_id][1]).upper()
+    if len(fields['currency']) != 3:
+        raise RowError(f"Invalid currency {row.get('currency')!r}.")
+    fields['booking_reference'] = _text(row, 'booking_reference').upper()
+    if len(fields['booking_reference']) > Booking._meta.get_field('booking_reference').max_length:
+        raise RowError(f"Booking reference {row.get('booking_reference')!r} is too long.")
+    if is_generated_reference(fields['booking_reference']):
+        raise RowError(f"Booking reference {row.get('booking_reference')!r} has the format of generated references; rename it.")
+    return fields
+
+
+def _derive(batch):
+    """Compute nights, subtotal and total of a batch as save() would, in integer cents"""
+    check_in = np.array([fields['check_in_date'] for _, fields in batch], dtype='datetime64[D]')
+    check_out = np.array([fields['check_out_date'] for _, fields in batch], dtype='datetime64[D]')
+    nights = (check_out - check_in).astype(np.int64)
+    amounts = {
+        column: np.array([fields[column] for _, fields in batch], dtype=np.int64)
+        for column in AMOUNT_COLUMNS
+    }
+    subtotal = amounts['room_rate'] * nights
+    total = subtotal + amounts['tax_amount'] + amounts['fee_amount'] - amounts['discount_amount']
+    return nights, subtotal, total
+
+
+def _taken_nights(batch):
+    """Return {room_id: set of nights} already blocked for the rooms of a batch"""
+    blocking = [fields for _, fields in batch if fields['status'] in Booking.BLOCKING_STATUSES]
+    taken = defaultdict(set)
+    if not blocking:
+        return taken
+    room_ids = {fields['room_id'] for fields in blocking}
+    start = min(fields['check_in_date'] for fields in blocking)
+    end = max(fields['check_out_date'] for fields in blocking)
+    for room_id, check_in, check_out in overlapping_bookings(room_ids, start, end).values_list(
+        'room_id', 'check_in_date', 'check_out_date'
+    ):
+        taken[room_id].update(date_range(max(check_in, start), min(check_out, end)))
+    for room_id, night in blocked_days(room_ids, start, end).values_list('room_id', 'date'):
+        taken[room_id].add(night)
+    return taken
+
+
+def _write(bookings, holds):
+    """Write one batch of bookings and their holds, then refresh the caches of their rooms"""
+    with transaction.atomic():
+        Booking.objects.bulk_create(bookings)
+        RoomNightHold.objects.bulk_create(holds)
+
+        ranges = {}
+        for booking in bookings:
+            first, end = ranges.get(booking.room_id, (booking.check_in_date, booking.check_out_date))
+            ranges[booking.room_id] = (min(first, booking.check_in_date), max(end, booking.check_out_date))
+
+        def refresh():
+            from rentals.cache import invalidate_rooms
+            for room_id, (start, end) in ranges.items():
+                refresh_nights(room_id, start, end)
+            invalidate_rooms(ranges)
+        transaction.on_commit(refresh)
+
+
+def import_bookings(rows, batch_size=BOOKING_IMPORT_BATCH_SIZE, rooms=None):
+    """Import bookings from (line number, row) pairs, e.g. from csv_rows()
+
+    Each row is a dict with the REQUIRED_COLUMNS and optionally
+    booking_reference, status (default checked_out for past stays,
+    checked_in for stays under way, else confirmed), source (default other),
+    currency (default the room's), tax_amount, fee_amount, discount_amount,
+    guest counts and the other guest fields. `rooms` is an optional Room
+    queryset limiting which rooms may be written.
+    """
+    started = time.perf_counter()
+    rooms = Room.objects.all() if rooms is None else rooms
+    # One lookup map for the whole import: room id -> (hotel id, currency)
+    room_map = {room_id: (hotel_id, currency) for room_id, hotel_id, currency in rooms.values_list('id', 'hotel_id', 'currency')}
+    today = timezone.localdate()
+
+    written = 0
+    errors = []
+    error_count = 0
+    seen_references = set()
+
+    def report(line, message):
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append((line, message))
+
+    def flush(batch):
+        nonlocal written
+        nights, subtotal, total = _derive(batch)
+        given = {fields['booking_reference'] for _, fields in batch if fields['booking_reference']}
+        existing = set(Booking.objects.filter(booking_reference__in=given).values_list('booking_reference', flat=True))
+        taken = _taken_nights(batch)
+
+        bookings, holds, lines = [], [], []
+        for index, (line, fields) in enumerate(batch):
+            if nights[index] <= 0:
+                report(line, 'check_out_date must be after check_in_date.')
+                continue
+            if abs(total[index]) >= MAX_CENTS or subtotal[index] >= MAX_CENTS:
+                report(line, 'The booking total is too large.')
+                continue
+            reference = fields['booking_reference']
+            if reference and (reference in existing or reference in seen_references):
+                report(line, f'Booking reference {reference} already exists.')
+                continue
+            stay = list(date_range(fields['check_in_date'], fields['check_out_date']))
+            blocking = fields['status'] in Booking.BLOCKING_STATUSES
+            if blocking and taken[fields['room_id']].intersection(stay):
+                report(line, 'The room is already booked or blocked for some of these nights.')
+                continue
+
+            booking = Booking(
+                hotel_id=room_map[fields['room_id']][0],
+                booking_reference=reference or next_booking_reference(),
+                nights=int(nights[index]),
+                room_rate=from_cents(fields['room_rate']),
+                tax_amount=from_cents(fields['tax_amount']),
+                fee_amount=from_cents(fields['fee_amount']),
+                discount_amount=from_cents(fields['discount_amount']),
+                subtotal=from_cents(subtotal[index]),
+                total_amount=from_cents(total[index]),
+                **{column: value for column, value in fields.items() if column not in AMOUNT_COLUMNS and column != 'booking_reference'},
+            )
+            seen_references.add(booking.booking_reference)
+            bookings.append(booking)
+            lines.append(line)
+            if blocking:
+                taken[booking.room_id].update(stay)
+                holds.extend(RoomNightHold(room_id=booking.room_id, date=night, booking=booking) for night in stay)
+        if not bookings:
+            return
+        try:
+            _write(bookings, holds)
+        except IntegrityError:
+            # A booking made while the import ran took one of the nights or references
+            for line in lines:
+                report(line, 'Batch not written: a booking made during the import conflicts with it.')
+            return
+        written += len(bookings)
+
+    batch = []
+    line = 0
+    stopped = None
+    try:
+        for line, row in rows:
+            try:
+                batch.append((line, _parse(row, room_map, today)))
+            except RowError as error:
+                report(line, str(error))
+                continue
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+    except (UnicodeDecodeError, csv.Error) as error:
+        # A missing header is still raised; it stops the import before any row
+        stopped = f'Could not read past line {line}: {error}'
+    if batch:
+        flush(batch)
+    return BookingImportResult(written, errors, error_count, time.perf_counter() - started, stopped)
@@ -0,0 +1,131 @@
+"""
+Interval index over a room's RoomPricing date ranges.
+
+The rule boundaries (start_date and the day after end_date) split the calendar
+into segments in which the same set of rules applies. The boundaries are kept
+in a sorted list, so the segment holding any night is found with a binary
+search. For each segment the winning rule of every weekday is worked out once
+when the index is built, using the precedence documented in bookings.pricing.
+
+Indexes are cached per room in the configured Django cache and dropped when
+one of the room's rules is saved or deleted.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+from django.core.cache import cache
+
+from rentals.models import RoomPricing
+
+RULE_INDEX_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
+
+# Rank of RoomPricing.pricing_type when several rules match the same night
+RULE_PRECEDENCE = {
+    'base': 0,
+    'weekend': 1,
+    'seasonal': 2,
+    'holiday': 3,
+    'special': 4,
+}
+
+WEEKDAY_FIELDS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Open-ended rules reach the first and last representable nights
+FIRST_NIGHT = date.min.toordinal()
+LAST_NIGHT = date.max.toordinal()
+
+
+def rule_rank(rule):
+    """Sort key of a rule: higher pricing type first, then the newest"""
+    return RULE_PRECEDENCE.get(rule.pricing_type, 0), rule.created_at
+
+
+class RuleIndex:
+    """The active pricing rules of one room, indexed by the nights they cover"""
+
+    def __init__(self, rules):
+        rules = sorted(rules, key=rule_rank, reverse=True)
+        spans = [
+            (
+                rule.start_date.toordinal() if rule.start_date else FIRST_NIGHT,
+                rule.end_date.toordinal() + 1 if rule.end_date else LAST_NIGHT + 1,
+                rule,
+            )
+            for rule in rules
+        ]
+        spans = [span for span in spans if span[0] < span[1]]
+
+        # boundaries[i] is the first night of segment i, which ends where i + 1 starts
+        self.boundaries = sorted({FIRST_NIGHT} | {start for start, _, _ in spans} | {end for _, end, _ in spans})
+        self.segments = [[] for _ in self.boundaries]
+        for start, end, rule in spans:
+            for segment in range(bisect_left(self.boundaries, start), bisect_left(self.boundaries, end)):
+                self.segments[segment].append(rule)
+        # The first rule of a segment for each weekday wins, since rules are in rank order
+        self.winners = [
+            tuple(next((rule for rule in segment if getattr(rule, day)), None) for day in WEEKDAY_FIELDS)
+            for segment in self.segments
+        ]
+
+    def _segment(self, ordinal):
+        return bisect_right(self.boundaries, ordinal) - 1
+
+    def rules_at(self, night):
+        """Return the rules that apply to one night, the winning rule first"""
+        field = WEEKDAY_FIELDS[night.weekday()]
+        return [rule for rule in self.segments[self._segment(night.toordinal())] if getattr(rule, field)]
+
+    def rule_at(self, night):
+        """Return the rule that sets the price of one night, or None"""
+        return self.winners[self._segment(night.toordinal())][night.weekday()]
+
+    def rules_between(self, start, end):
+        """Return the rules covering any night from start up to (not including) end"""
+        found = {}
+        for _, _, segment in self.segments_between(start, end):
+            for rule in self.segments[segment]:
+                found.setdefault(rule.pk, rule)
+        return list(found.values())
+
+    def segments_between(self, start, end):
+        """Yield (first offset, end offset, segment) for the segments covering start..end
+
+        Offsets count nights from start; the segment number indexes
+        `segments` and `winners`.
+        """
+        start, end = start.toordinal(), end.toordinal()
+        if start >= end:
+            return
+        first = self._segment(start)
+        last = self._segment(end - 1)
+        for segment in range(first, last + 1):
+            segment_start = max(self.boundaries[segment], start)
+            segment_end = min(self.boundaries[segment + 1], end) if segment + 1 < len(self.boundaries) else end
+            yield segment_start - start, segment_end - start, segment
+
+
+def _index_key(room_id):
+    return f"pricing:rule-index:{room_id}"
+
+
+def rule_indexes(room_ids):
+    """Return {room_id: RuleIndex}, building and caching any that are missing (at most one query)"""
+    room_ids = list(room_ids)
+    keys = {_index_key(room_id): room_id for room_id in room_ids}
+    cached = cache.get_many(list(keys))
+    indexes = {keys[key]: index for key, index in cached.items()}
+
+    missing = [room_id for room_id in room_ids if room_id not in indexes]
+    if missing:
+        rules = {room_id: [] for room_id in missing}
+        for rule in RoomPricing.objects.filter(room_id__in=missing, is_active=True):
+            rules[rule.room_id].append(rule)
+        built = {room_id: RuleIndex(room_rules) for room_id, room_rules in rules.items()}
+        cache.set_many({_index_key(room_id): index for room_id, index in built.items()}, RULE_INDEX_TIMEOUT)
+        indexes.update(built)
+    return indexes
+
+
+def invalidate_rule_indexes(room_ids):
+    """Drop the cached indexes of rooms whose rules changed"""
+    cache.delete_many([_index_key(room_id) for room_id in room_ids])
@@ -0,0 +1,192 @@
+"""
+Booking lifecycle sweeper: moves bookings through their statuses on schedule.
+
+Each run applies these transitions, in this order:
+
+- confirmed: pending bookings with a completed payment;
+- hold_expired: unpaid bookings whose room-night holds expired are
+  cancelled through bookings.holds.release_expired. It runs after
+  confirmed, so a paid booking is never cancelled for an expired hold;
+- expired: pending bookings without a payment, older than
+  BOOKING_PENDING_EXPIRY_HOURS (default 48), are cancelled. This catches
+  pending bookings made without holds, e.g. by staff;
+- no_show: confirmed bookings whose check-in day is BOOKING_NO_SHOW_GRACE_DAYS
+  behind, but at most BOOKING_NO_SHOW_WINDOW_DAYS (default 7) more, so old
+  history left confirmed is not rewritten;
+- checked_out: checked-in stays whose check-out day has passed.
+
+Every other transition is a set-based update() over bounded batches of ids. The
+status filter is applied again in the UPDATE, so a booking changed by staff
+in the meantime is left alone. Timestamps are set in SQL. update() sends no
+signals, so the room-night holds of bookings that stop blocking their room
+are released here, and the availability caches refreshed on commit.
+
+Counters of each run are returned and also added to totals in the cache,
+which /metrics/ exposes.
+"""
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Exists, OuterRef, TextField, Value, When
+from django.db.models.functions import Concat, Now
+from django.utils import timezone
+
+from .availability import refresh_nights
+from .holds import release_expired
+from .models import Booking, Payment, RoomNightHold
+
+SWEEP_BATCH_SIZE = 1000
+PAID_STATUSES = ['completed', 'paid']
+TRANSITIONS = ['confirmed', 'hold_expired', 'expired', 'no_show', 'checked_out']
+LAST_RUN_KEY = 'booking-sweeper:last-run'
+EXPIRED_NOTE = 'Expired unpaid before confirmation.'
+
+# One status change: which bookings it applies to and what it writes
+Transition = namedtuple('Transition', ['name', 'queryset', 'changes', 'releases_holds'])
+
+
+def pending_expiry():
+    return timedelta(hours=getattr(settings, 'BOOKING_PENDING_EXPIRY_HOURS', 48))
+
+
+def no_show_grace():
+    return timedelta(days=getattr(settings, 'BOOKING_NO_SHOW_GRACE_DAYS', 1))
+
+
+def no_show_window():
+    return timedelta(days=getattr(settings, 'BOOKING_NO_SHOW_WINDOW_DAYS', 7))
+
+
+def _paid():
+    return Exists(Payment.objects.filter(booking=OuterRef('pk'), status__in=PAID_STATUSES))
+
+
+def _counter_key(name):
+    return f'booking-sweeper:{name}'
+
+
+def transitions(now=None):
+    """Return the update() transitions of one run, in the order they are applied"""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    paid = _paid()
+    pending = Booking.objects.filter(status='pending')
+    return [
+        Transition(
+            'confirmed',
+            pending.filter(paid),
+            {'status': 'confirmed', 'confirmed_at': Now()},
+            False,
+        ),
+        Transition(
+            'expired',
+            pending.filter(~paid, created_at__lt=now - pending_expiry()),
+            {
+                'status': 'cancelled',
+                'cancelled_at': Now(),
+                'internal_notes': Case(
+                    When(internal_notes='', then=Value(EXPIRED_NOTE)),
+                    default=Concat('internal_notes', Value('\n' + EXPIRED_NOTE)),
+                    output_field=TextField(),
+                ),
+            },
+            True,
+        ),
+        Transition(
+            'no_show',
+            Booking.objects.filter(
+                status='confirmed',
+                check_in_date__lte=today - no_show_grace(),
+                check_in_date__gt=today - no_show_grace() - no_show_window(),
+            ),
+            {'status': 'no_show'},
+            True,
+        ),
+        Transition(
+            'checked_out',
+            Booking.objects.filter(status='checked_in', check_out_date__lt=today),
+            {'status': 'checked_out', 'actual_check_out': Now()},
+            True,
+        ),
+    ]
+
+
+def _apply(transition, batch_size):
+    """Apply one transition in batches; return how many bookings changed"""
+    changed = 0
+    while True:
+        with transaction.atomic():
+            # Rows another sweeper has locked are left for the next run
+            rows = list(
+                transition.queryset.select_for_update(skip_locked=True)
+                .order_by('pk')
+                .values_list('pk', 'room_id', 'check_in_date', 'check_out_date')[:batch_size]
+            )
+            if not rows:
+                break
+            ids = [pk for pk, _, _, _ in rows]
+            changed += transition.queryset.filter(pk__in=ids).update(updated_at=Now(), **transition.changes)
+            if transition.releases_holds:
+                RoomNightHold.objects.filter(booking_id__in=ids).delete()
+                stays = {(room_id, check_in, check_out) for _, room_id, check_in, check_out in rows}
+
+                def refresh(stays=stays):
+                    from rentals.cache import invalidate_rooms
+                    for room_id, check_in, check_out in stays:
+                        refresh_nights(room_id, check_in, check_out)
+                    invalidate_rooms({room_id for room_id, _, _ in stays})
+                transaction.on_commit(refresh)
+        if len(rows) < batch_size:
+            break
+    return changed
+
+
+def sweep_bookings(now=None, batch_size=SWEEP_BATCH_SIZE, dry_run=False):
+    """Run every transition once; return {transition name: bookings changed}
+
+    With dry_run, nothing is written and the counts are how many bookings
+    each transition would pick up.
+    """
+    now = now or timezone.now()
+    counters = {}
+    for transition in transitions(now):
+        if dry_run:
+            counters[transition.name] = transition.queryset.count()
+        else:
+            counters[transition.name] = _apply(transition, batch_size)
+        if transition.name == 'confirmed':
+            counters['hold_expired'] = _release_holds(now, batch_size, dry_run)
+    if not dry_run:
+        _record(counters)
+    return counters
+
+
+def _release_holds(now, batch_size, dry_run):
+    """Cancel unpaid bookings whose holds expired; return how many"""
+    if dry_run:
+        expired = Booking.objects.filter(~_paid(), status='pending', holds__expires_at__lt=now)
+        return expired.values('pk').distinct().count()
+    return release_expired(now=now, batch_size=batch_size)
+
+
+def _record(counters):
+    for name, count in counters.items():
+        key = _counter_key(name)
+        cache.add(key, 0, None)
+        if count:
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                pass
+    cache.set(LAST_RUN_KEY, timezone.now().timestamp(), None)
+
+
+def sweeper_stats():
+    """Return the total bookings moved by each transition, and when the sweeper last ran"""
+    stored = cache.get_many([_counter_key(name) for name in TRANSITIONS] + [LAST_RUN_KEY])
+    stats = {name: stored.get(_counter_key(name), 0) for name in TRANSITIONS}
+    stats['last_run'] = stored.get(LAST_RUN_KEY)
+    return stats
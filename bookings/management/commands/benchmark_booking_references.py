@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from bookings.references import next_booking_reference
+
+
+class Command(BaseCommand):
+    help = 'Generate booking references and report the rate, queries and uniqueness'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100000, help='How many references to generate')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            references = [next_booking_reference() for _ in range(count)]
+            elapsed = time.perf_counter() - started
+
+        unique = len(set(references))
+        rate = count / elapsed if elapsed else float('inf')
+        self.stdout.write(f'First reference: {references[0]}, last: {references[-1]}' if references else 'No references generated')
+        self.stdout.write(f'{count} references in {elapsed:.3f}s ({rate:,.0f} per second)')
+        self.stdout.write(f'{len(queries)} queries (block reservations)')
+        if unique == count:
+            self.stdout.write(self.style.SUCCESS(f'All {count} references are unique'))
+        else:
+            self.stdout.write(self.style.ERROR(f'{count - unique} duplicate references'))
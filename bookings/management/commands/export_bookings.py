@@ -0,0 +1,63 @@
+import sys
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from users.models import Hotel
+from bookings.exports import EXPORTS, EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_chunks, export_queryset
+
+
+def _date(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if not day:
+        raise CommandError(f'Invalid date {value!r}. Use YYYY-MM-DD.')
+    return day
+
+
+class Command(BaseCommand):
+    help = 'Stream bookings or payments to a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+        parser.add_argument('--hotel', help='Hotel id or slug')
+        parser.add_argument('--start-date', type=_date, help='First date, inclusive (check-in for bookings, creation for payments)')
+        parser.add_argument('--end-date', type=_date, help='Last date, inclusive')
+        parser.add_argument('--status', action='append', default=[], help='Only this status (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Rows read per database round trip')
+
+    def handle(self, *args, **options):
+        hotels = None
+        if options['hotel']:
+            try:
+                hotels = Hotel.objects.filter(pk=uuid.UUID(options['hotel']))
+            except ValueError:
+                hotels = Hotel.objects.filter(slug=options['hotel'])
+            if not hotels.exists():
+                raise CommandError(f"Hotel {options['hotel']!r} not found.")
+
+        rows = export_queryset(
+            options['kind'],
+            hotels=hotels,
+            start_date=options['start_date'],
+            end_date=options['end_date'],
+            statuses=options['status'],
+        )
+        chunks = export_chunks(options['kind'], rows, options['export_format'], chunk_size=options['chunk_size'])
+        try:
+            output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        except OSError as error:
+            raise CommandError(error)
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Exported {options['kind']} to {options['output']}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.imports import BOOKING_IMPORT_BATCH_SIZE, csv_rows, import_bookings
+
+
+class Command(BaseCommand):
+    help = 'Import bookings from a CSV export of another PMS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with room, check_in_date, check_out_date, guest and room_rate columns')
+        parser.add_argument('--batch-size', type=int, default=BOOKING_IMPORT_BATCH_SIZE, help='Rows written per batch')
+
+    def handle(self, *args, **options):
+        try:
+            # Decoded line by line, so a bad byte stops the import at its own line
+            with open(options['path'], 'rb') as csv_file:
+                lines = (line.decode('utf-8-sig') for line in csv_file)
+                result = import_bookings(csv_rows(lines), batch_size=options['batch_size'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for line, message in result.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+        rate = result.written / result.seconds if result.seconds else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.written} bookings in {result.seconds:.2f}s ({rate:,.0f} rows per second, '
+            f'{result.error_count} rows skipped)'
+        ))
+        if result.stopped:
+            raise CommandError(f'{result.stopped}. {result.written} bookings were imported before it.')
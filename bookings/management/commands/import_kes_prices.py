@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bookings.daily_prices import DAILY_PRICE_BATCH_SIZE, import_kes_prices
+
+
+class Command(BaseCommand):
+    help = 'Import daily room prices from a CSV of room, date and kes_price rows, converted to USD'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with room, date and kes_price columns')
+        parser.add_argument('--batch-size', type=int, default=DAILY_PRICE_BATCH_SIZE, help='Rows written per batch')
+
+    def handle(self, *args, **options):
+        try:
+            # Decoded line by line, so a bad byte stops the import at its own line
+            with open(options['path'], 'rb') as csv_file:
+                lines = (line.decode('utf-8-sig') for line in csv_file)
+                result = import_kes_prices(lines, batch_size=options['batch_size'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        for line, message in result.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.written} daily prices ({result.error_count} rows skipped)'
+        ))
+        if result.stopped:
+            raise CommandError(f'{result.stopped}. {result.written} daily prices were imported before it.')
@@ -0,0 +1,67 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from rentals.models import Room
+from bookings.models import NightlyRateRebuild
+from bookings.pricing import NIGHTLY_RATE_HORIZON_DAYS, materialize_rates
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or touching (start, end) ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized nightly rates of rooms whose pricing changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild every active room for the whole horizon instead of only the queued ranges',
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        horizon = today + timedelta(days=NIGHTLY_RATE_HORIZON_DAYS)
+
+        # Changes queued while this runs get a higher id and wait for the next run
+        last_id = NightlyRateRebuild.objects.aggregate(last=Max('id'))['last'] or 0
+        pending = NightlyRateRebuild.objects.filter(id__lte=last_id)
+
+        if options['full']:
+            room_ranges = {room_id: [(today, horizon)] for room_id in Room.objects.filter(is_active=True).values_list('id', flat=True)}
+        else:
+            room_ranges = defaultdict(list)
+            for room_id, start, end in pending.values_list('room_id', 'start_date', 'end_date'):
+                start = max(start or today, today)
+                end = min(end or horizon, horizon)
+                if start < end:
+                    room_ranges[room_id].append((start, end))
+
+        # Rooms sharing a range are compiled together
+        rooms_by_range = defaultdict(list)
+        rooms = Room.objects.in_bulk(list(room_ranges))
+        for room_id, ranges in room_ranges.items():
+            if room_id in rooms:
+                for date_range in merge_ranges(ranges):
+                    rooms_by_range[date_range].append(rooms[room_id])
+
+        written = 0
+        for (start, end), range_rooms in rooms_by_range.items():
+            written += materialize_rates(range_rooms, start, end)
+
+        cleared, _ = pending.delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} nightly rates for {len(rooms)} rooms ({cleared} queued changes cleared)'
+        ))
@@ -0,0 +1,89 @@
+import random
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from rentals.models import Room
+from bookings.holds import RoomUnavailable, hold_booking
+from bookings.models import Booking
+from bookings.pricing import price_booking
+
+STRESS_EMAIL = 'stress-test@guestflow.invalid'
+
+
+class Command(BaseCommand):
+    help = 'Hammer one room with concurrent overlapping bookings and check that none were double-booked'
+
+    def add_arguments(self, parser):
+        parser.add_argument('room', help='Id of the room to book')
+        parser.add_argument('--threads', type=int, default=20)
+        parser.add_argument('--attempts', type=int, default=10, help='Bookings each thread tries')
+        parser.add_argument('--window', type=int, default=30, help='Nights the random stays are spread over')
+        parser.add_argument('--offset', type=int, default=400, help='Days from today to the start of the window')
+        parser.add_argument('--keep', action='store_true', help='Keep the test bookings instead of deleting them')
+
+    def handle(self, *args, **options):
+        try:
+            room = Room.objects.get(pk=options['room'])
+        except (Room.DoesNotExist, ValueError, DatabaseError):
+            raise CommandError(f"Room {options['room']} not found")
+        start = timezone.localdate() + timedelta(days=options['offset'])
+        counts = {'booked': 0, 'conflict': 0, 'error': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options['attempts']):
+                    check_in = start + timedelta(days=rng.randrange(options['window']))
+                    booking = Booking(
+                        room=room,
+                        guest_name='Stress Test',
+                        guest_email=STRESS_EMAIL,
+                        guest_phone='0',
+                        check_in_date=check_in,
+                        check_out_date=check_in + timedelta(days=rng.randint(1, 4)),
+                    )
+                    price_booking(booking)
+                    try:
+                        with transaction.atomic():
+                            booking.save()
+                            hold_booking(booking)
+                        outcome = 'booked'
+                    except RoomUnavailable:
+                        outcome = 'conflict'
+                    except DatabaseError:
+                        outcome = 'error'
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        began = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - began
+
+        booked = list(
+            Booking.objects.filter(room=room, guest_email=STRESS_EMAIL, status__in=Booking.BLOCKING_STATUSES)
+            .order_by('check_in_date')
+            .values_list('check_in_date', 'check_out_date')
+        )
+        overlaps = sum(1 for previous, current in zip(booked, booked[1:]) if current[0] < previous[1])
+        if not options['keep']:
+            Booking.objects.filter(room=room, guest_email=STRESS_EMAIL).delete()
+
+        self.stdout.write(
+            f"{counts['booked']} booked, {counts['conflict']} rejected as conflicts, "
+            f"{counts['error']} database errors in {elapsed:.2f}s"
+        )
+        if overlaps:
+            raise CommandError(f'{overlaps} overlapping bookings were committed')
+        self.stdout.write(self.style.SUCCESS('No overlapping bookings'))
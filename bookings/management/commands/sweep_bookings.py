@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookings.lifecycle import SWEEP_BATCH_SIZE, sweep_bookings
+
+
+class Command(BaseCommand):
+    help = 'Confirm paid bookings, release expired holds, expire stale pending ones, mark no-shows and check out ended stays'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help='Bookings updated per statement')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the bookings each step would change')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counters = sweep_bookings(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        elapsed = time.perf_counter() - started
+
+        verb = 'Would change' if options['dry_run'] else 'Changed'
+        for name, count in counters.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'{verb} {sum(counters.values())} bookings in {elapsed:.2f}s'))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_initial'),
+        ('rentals', '0004_room_rental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NightlyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, help_text="Effective price in the room's currency", max_digits=10)),
+                ('currency', models.CharField(default='USD', max_length=3)),
+                ('source', models.CharField(choices=[('base', 'Room Base Price'), ('rule', 'Room Pricing Rule'), ('daily', 'Daily Room Price'), ('override', 'Availability Price Override')], default='base', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('daily_price', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='bookings.dailyroomprice')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='materialized_rates', to='rentals.room')),
+            ],
+            options={
+                'verbose_name': 'Nightly Rate',
+                'verbose_name_plural': 'Nightly Rates',
+                'ordering': ['date'],
+                'unique_together': {('room', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='NightlyRateRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_date', models.DateField(blank=True, help_text='First stale night (empty means open-ended)', null=True)),
+                ('end_date', models.DateField(blank=True, help_text='Night after the last stale one (empty means open-ended)', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rentals.room')),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['room', 'start_date'], name='bookings_ni_room_id_5de8dc_idx')],
+            },
+        ),
+    ]
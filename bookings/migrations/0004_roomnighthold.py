@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_nightlyrate_nightlyraterebuild'),
+        ('rentals', '0004_room_rental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNightHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Empty once the booking is paid or confirmed', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='bookings.booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rentals.room')),
+            ],
+            options={
+                'ordering': ['room', 'date'],
+                'indexes': [models.Index(fields=['expires_at'], name='bookings_ro_expires_bdf8e2_idx')],
+                'unique_together': {('room', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_roomnighthold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingReferenceBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -1,9 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from rentals.models import Room, Hotel
 from django.core.validators import MinValueValidator
 import uuid
-from datetime import datetime, timedelta
+from datetime import timedelta
+from decimal import Decimal
 
 User = get_user_model()
 
@@ -31,6 +32,9 @@ class Booking(models.Model):
         ('other', 'Other'),
     ]
     
+    # Statuses that hold a room for the nights of the stay
+    BLOCKING_STATUSES = ['pending', 'confirmed', 'checked_in']
+    
     # Basic Information
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     booking_reference = models.CharField(max_length=20, unique=True, help_text="Unique booking reference")
@@ -99,6 +103,10 @@ class Booking(models.Model):
         return f"{self.booking_reference} - {self.guest_name} ({self.room.name})"
     
     def save(self, *args, **kwargs):
+        # Auto-assign hotel from room
+        if self.room_id and not self.hotel_id:
+            self.hotel = self.room.hotel
+        
         if not self.booking_reference:
             self.booking_reference = self.generate_booking_reference()
         
@@ -106,29 +114,41 @@ class Booking(models.Model):
         if self.check_in_date and self.check_out_date:
             self.nights = (self.check_out_date - self.check_in_date).days
         
-        # Calculate subtotal
-        if self.room_rate and self.nights:
+        # Calculate subtotal (from the exact nightly rates when the pricing engine quoted them)
+        nightly_rates = getattr(self, 'nightly_rates', None)
+        if nightly_rates:
+            self.subtotal = sum(nightly_rates, Decimal('0.00'))
+        elif self.room_rate and self.nights:
             self.subtotal = self.room_rate * self.nights
         
         # Calculate total
         self.total_amount = self.subtotal + self.tax_amount + self.fee_amount - self.discount_amount
         
-        # Auto-assign hotel from room
-        if self.room and not self.hotel_id:
-            self.hotel = self.room.hotel
-        
-        super().save(*args, **kwargs)
+        # The post_save hold sync runs inside, so a room-night conflict undoes the save
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def clean(self):
+        """Refuse to block nights another booking or a block already holds"""
+        from django.core.exceptions import ValidationError
+        from .holds import stay_conflict
+        super().clean()
+        if self.status not in self.BLOCKING_STATUSES or not (self.room_id and self.check_in_date and self.check_out_date):
+            return
+        if self.check_in_date >= self.check_out_date:
+            raise ValidationError({'check_out_date': 'Check-out must be after check-in.'})
+        stored = None if self._state.adding else Booking.objects.filter(pk=self.pk).first()
+        if stored and stored.status in self.BLOCKING_STATUSES and _nights_covered(stored) == _nights_covered(self):
+            # The booking already holds these nights
+            return
+        conflict = stay_conflict(self)
+        if conflict:
+            raise ValidationError(conflict)
     
     def generate_booking_reference(self):
-        """Generate unique booking reference"""
-        import string
-        import random
-        
-        prefix = self.hotel.property_type.upper()[:2] if self.hotel else 'BK'
-        timestamp = datetime.now().strftime('%Y%m%d')
-        random_suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=4))
-        
-        return f"{prefix}{timestamp}{random_suffix}"
+        """Generate unique booking reference (see bookings.references)"""
+        from .references import next_booking_reference
+        return next_booking_reference()
     
     @property
     def duration_text(self):
@@ -239,4 +259,216 @@ class DailyRoomPrice(models.Model):
         ordering = ['date']
     
     def __str__(self):
-        return f"{self.room.name} - {self.date}: {self.price} {self.currency}"
\ No newline at end of file
+        return f"{self.room.name} - {self.date}: {self.price} {self.currency}"
+class NightlyRate(models.Model):
+    """Materialized effective rate of a room for one night (see bookings.pricing)"""
+    SOURCE_CHOICES = [
+        ('base', 'Room Base Price'),
+        ('rule', 'Room Pricing Rule'),
+        ('daily', 'Daily Room Price'),
+        ('override', 'Availability Price Override'),
+    ]
+    
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='materialized_rates')
+    date = models.DateField()
+    price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Effective price in the room's currency")
+    currency = models.CharField(max_length=3, default='USD')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='base')
+    daily_price = models.ForeignKey(DailyRoomPrice, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['room', 'date']
+        ordering = ['date']
+        verbose_name = 'Nightly Rate'
+        verbose_name_plural = 'Nightly Rates'
+    
+    def __str__(self):
+        return f"{self.room.name} - {self.date}: {self.price} {self.currency}"
+
+class NightlyRateRebuild(models.Model):
+    """A room and date range whose NightlyRate rows are out of date"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='+')
+    start_date = models.DateField(null=True, blank=True, help_text="First stale night (empty means open-ended)")
+    end_date = models.DateField(null=True, blank=True, help_text="Night after the last stale one (empty means open-ended)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['room', 'start_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.room_id}: {self.start_date or '...'} - {self.end_date or '...'}"
+
+class BookingReferenceBlock(models.Model):
+    """A block of booking reference numbers reserved by one process (see bookings.references)"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Block {self.pk}"
+
+class RoomNightHold(models.Model):
+    """One night of a room taken by a booking (see bookings.holds)
+    
+    Unique per room and night, so two overlapping bookings can never both
+    commit. Holds of unpaid bookings expire; paid or confirmed ones do not.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='holds')
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Empty once the booking is paid or confirmed")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['room', 'date']
+        ordering = ['room', 'date']
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.room_id} - {self.date} ({self.booking_id})"
+
+# Signal handlers keeping the cached availability bitmaps in sync
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from rentals.models import RoomAvailability, RoomPricing
+
+def _nights_covered(instance):
+    """Return (room_id, first night, night after the last) covered by a Booking or RoomAvailability"""
+    if isinstance(instance, Booking):
+        return instance.room_id, instance.check_in_date, instance.check_out_date
+    return instance.room_id, instance.date, instance.date + timedelta(days=1)
+
+@receiver(pre_save, sender=Booking)
+@receiver(pre_save, sender=Room)
+@receiver(pre_save, sender=RoomPricing)
+@receiver(pre_save, sender=DailyRoomPrice)
+@receiver(pre_save, sender=RoomAvailability)
+def remember_stored_row(sender, instance, **kwargs):
+    """Remember the row as stored before this save, to know which nights it covered"""
+    instance._stored_row = None
+    if not instance._state.adding:
+        instance._stored_row = sender.objects.filter(pk=instance.pk).first()
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=RoomAvailability)
+@receiver(post_delete, sender=RoomAvailability)
+def refresh_availability_bitmap(sender, instance, **kwargs):
+    """Recompute the cached availability bits for the nights the row touched"""
+    from .availability import refresh_nights
+    ranges = {_nights_covered(instance)}
+    if getattr(instance, '_stored_row', None):
+        ranges.add(_nights_covered(instance._stored_row))
+    for room_id, start, end in ranges:
+        if room_id and start and end:
+            transaction.on_commit(lambda r=room_id, s=start, e=end: refresh_nights(r, s, e))
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=DailyRoomPrice)
+@receiver(post_delete, sender=DailyRoomPrice)
+def invalidate_room_searches(sender, instance, **kwargs):
+    """Drop cached room searches of the rental whose rooms changed"""
+    from rentals.cache import invalidate_rooms
+    room_ids = {instance.room_id}
+    if getattr(instance, '_stored_row', None):
+        room_ids.add(instance._stored_row.room_id)
+    transaction.on_commit(lambda: invalidate_rooms(room_ids))
+
+@receiver(post_save, sender=RoomPricing)
+@receiver(post_delete, sender=RoomPricing)
+def invalidate_rule_index(sender, instance, **kwargs):
+    """Drop the cached pricing rule index of the room whose rules changed"""
+    from .intervals import invalidate_rule_indexes
+    room_ids = {instance.room_id}
+    if getattr(instance, '_stored_row', None):
+        room_ids.add(instance._stored_row.room_id)
+    transaction.on_commit(lambda: invalidate_rule_indexes(room_ids))
+
+def _priced_nights(instance):
+    """Return the (start, end) nights a pricing row affects, or None if it sets no price"""
+    if isinstance(instance, Room):
+        return None, None
+    if isinstance(instance, RoomPricing):
+        end = instance.end_date + timedelta(days=1) if instance.end_date else None
+        return instance.start_date, end
+    if isinstance(instance, RoomAvailability) and instance.price_override is None:
+        return None
+    return instance.date, instance.date + timedelta(days=1)
+
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=RoomPricing)
+@receiver(post_delete, sender=RoomPricing)
+@receiver(post_save, sender=DailyRoomPrice)
+@receiver(post_delete, sender=DailyRoomPrice)
+@receiver(post_save, sender=RoomAvailability)
+@receiver(post_delete, sender=RoomAvailability)
+def queue_nightly_rate_rebuild(sender, instance, **kwargs):
+    """Queue the nights whose materialized rates a change made stale"""
+    stored = getattr(instance, '_stored_row', None)
+    if sender is Room:
+        if stored and (stored.base_price, stored.currency) == (instance.base_price, instance.currency):
+            return
+        ranges = {(None, None)}
+        room_ids = {instance.pk}
+    else:
+        ranges = {_priced_nights(instance)}
+        room_ids = {instance.room_id}
+        if stored:
+            ranges.add(_priced_nights(stored))
+            room_ids.add(stored.room_id)
+    ranges.discard(None)
+    if not ranges:
+        return
+
+    def enqueue():
+        # Skip rooms that were deleted along with the row
+        existing = Room.objects.filter(pk__in=room_ids).values_list('pk', flat=True)
+        NightlyRateRebuild.objects.bulk_create([
+            NightlyRateRebuild(room_id=room_id, start_date=start, end_date=end)
+            for room_id in existing
+            for start, end in ranges
+        ])
+    transaction.on_commit(enqueue)
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_exchange_rates(sender, instance, **kwargs):
+    """Reload the exchange rates after one changed, and queue the rates converted with them"""
+    from .exchange import invalidate
+
+    def enqueue():
+        # Rooms priced in another currency somewhere; their whole horizon is stale
+        room_ids = set(RoomPricing.objects.exclude(currency=models.F('room__currency')).values_list('room_id', flat=True))
+        room_ids.update(DailyRoomPrice.objects.exclude(currency=models.F('room__currency')).values_list('room_id', flat=True))
+        NightlyRateRebuild.objects.bulk_create([NightlyRateRebuild(room_id=room_id) for room_id in room_ids])
+    transaction.on_commit(invalidate)
+    transaction.on_commit(enqueue)
+
+@receiver(post_save, sender=Booking)
+def sync_room_night_holds(sender, instance, **kwargs):
+    """Keep a booking's holds on its nights while it blocks the room, for good once confirmed"""
+    from .holds import release_holds, confirm_holds, move_holds
+    if instance.status not in Booking.BLOCKING_STATUSES:
+        release_holds(instance)
+        return
+    stored = getattr(instance, '_stored_row', None)
+    if stored and (
+        _nights_covered(stored) != _nights_covered(instance)
+        or stored.status not in Booking.BLOCKING_STATUSES
+    ):
+        # Moved to other nights or another room, or blocking again
+        move_holds(instance)
+    if instance.status != 'pending':
+        confirm_holds(instance)
+
+@receiver(post_save, sender=Payment)
+def confirm_paid_holds(sender, instance, **kwargs):
+    """A completed payment stops the booking's holds from expiring"""
+    from .holds import confirm_holds
+    if instance.status in ('completed', 'paid'):
+        confirm_holds(instance.booking)
@@ -0,0 +1,291 @@
+"""
+Pricing engine: the nightly rate of every room for a date range.
+
+All pricing sources are compiled into one int64 array of cents per room,
+expressed in the room's currency. Each array is evaluated with vectorized
+NumPy masks instead of night by night. Precedence, highest first:
+
+1. RoomAvailability.price_override for that night
+2. DailyRoomPrice for that night
+3. Active RoomPricing rules whose start_date/end_date and weekday flags match
+   the night. When several rules match, the higher pricing_type wins
+   (special > holiday > seasonal > weekend > base). Among rules of the same
+   type, the most recently created one wins. Rules are looked up through the
+   cached interval index in bookings.intervals.
+4. Room.base_price
+
+Every source is loaded for the whole set of rooms with one query. Amounts
+stored in another currency are converted to the room's currency through
+bookings.exchange.
+
+Read paths (calendars, search) use the materialized NightlyRate table instead,
+which the `rebuild_nightly_rates` command keeps up to date. Rooms whose rows
+are missing or queued for a rebuild are compiled live, so a stale row is
+never served. Booking prices are always compiled live.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from rentals.models import RoomAvailability
+from .charges import room_charges
+from .intervals import rule_indexes
+from . import exchange
+from .models import DailyRoomPrice, NightlyRate, NightlyRateRebuild
+
+# Where a night's price came from, lowest precedence first
+SOURCE_BASE = 0
+SOURCE_RULE = 1
+SOURCE_DAILY = 2
+SOURCE_OVERRIDE = 3
+SOURCE_NAMES = {
+    SOURCE_BASE: 'base',
+    SOURCE_RULE: 'rule',
+    SOURCE_DAILY: 'daily',
+    SOURCE_OVERRIDE: 'override',
+}
+
+SOURCE_CODES = {name: code for code, name in SOURCE_NAMES.items()}
+
+# How far ahead NightlyRate rows are kept
+NIGHTLY_RATE_HORIZON_DAYS = 730
+NIGHTLY_RATE_BATCH_SIZE = 1000
+
+# One night of a stay: `daily_price` is the DailyRoomPrice row the price came
+# from, or None when another source set it.
+NightlyPrice = namedtuple('NightlyPrice', ['date', 'price', 'daily_price', 'source'])
+
+
+class RoomRates(namedtuple('RoomRates', ['room', 'start', 'amounts', 'sources', 'daily_prices'])):
+    """Compiled nightly rates of one room
+
+    `amounts` holds cents in the room's currency and `sources` holds the
+    SOURCE_* code of each night. `daily_prices` maps night offsets to the
+    DailyRoomPrice row that set them.
+    """
+
+    def nights(self):
+        """Return the breakdown as a list of NightlyPrice"""
+        return [
+            NightlyPrice(
+                self.start + timedelta(days=offset),
+                from_cents(cents),
+                self.daily_prices.get(offset),
+                SOURCE_NAMES[int(source)],
+            )
+            for offset, (cents, source) in enumerate(zip(self.amounts, self.sources))
+        ]
+
+    def total(self):
+        return from_cents(self.amounts.sum())
+
+
+def date_range(start, end):
+    """Yield every date from start up to (but not including) end"""
+    for offset in range((end - start).days):
+        yield start + timedelta(days=offset)
+
+
+def to_cents(amount):
+    """Convert a Decimal amount to integer cents"""
+    return int((Decimal(amount) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Convert integer cents back to a Decimal amount"""
+    return (Decimal(int(cents)) / 100).quantize(Decimal('0.01'))
+
+
+def _to_room_currency(amount, currency, room_currency):
+    """Convert an amount to the room's currency with the exchange-rate service"""
+    try:
+        return exchange.convert(amount, currency, room_currency)
+    except exchange.MissingExchangeRate:
+        # No rate stored: use the amount as is, like the rest of the app
+        return amount
+
+
+def compile_rates(rooms, start, end):
+    """Return {room_id: RoomRates} for every night from start up to (not including) end"""
+    rooms = list(rooms)
+    nights = (end - start).days
+    room_ids = [room.id for room in rooms]
+
+    daily_rows = list(DailyRoomPrice.objects.filter(room_id__in=room_ids, date__gte=start, date__lt=end))
+    indexes = rule_indexes(room_ids)
+    overrides = RoomAvailability.objects.filter(
+        room_id__in=room_ids, date__gte=start, date__lt=end, price_override__isnull=False
+    ).values_list('room_id', 'date', 'price_override')
+
+    room_currency = {room.id: room.currency for room in rooms}
+    rules = [rule for room_id in room_ids for rule in indexes[room_id].rules_between(start, end)]
+
+    ordinals = np.arange(start.toordinal(), end.toordinal())
+    # date.fromordinal(1) is a Monday, so this matches date.weekday()
+    weekdays = (ordinals - 1) % 7
+
+    compiled = {}
+    for room in rooms:
+        compiled[room.id] = RoomRates(
+            room,
+            start,
+            np.full(nights, to_cents(room.base_price), dtype=np.int64),
+            np.full(nights, SOURCE_BASE, dtype=np.int8),
+            {},
+        )
+
+    rule_cents = {
+        rule.pk: to_cents(_to_room_currency(rule.price, rule.currency, room_currency[rule.room_id])) for rule in rules
+    }
+    for room_id in room_ids:
+        rates = compiled[room_id]
+        index = indexes[room_id]
+        for first, last, segment in index.segments_between(start, end):
+            segment_weekdays = weekdays[first:last]
+            for weekday, rule in enumerate(index.winners[segment]):
+                if rule is None:
+                    continue
+                mask = segment_weekdays == weekday
+                rates.amounts[first:last][mask] = rule_cents[rule.pk]
+                rates.sources[first:last][mask] = SOURCE_RULE
+
+    for row in daily_rows:
+        rates = compiled[row.room_id]
+        offset = (row.date - start).days
+        rates.amounts[offset] = to_cents(_to_room_currency(row.price, row.currency, room_currency[row.room_id]))
+        rates.sources[offset] = SOURCE_DAILY
+        rates.daily_prices[offset] = row
+
+    for room_id, day, price in overrides:
+        rates = compiled[room_id]
+        offset = (day - start).days
+        rates.amounts[offset] = to_cents(price)
+        rates.sources[offset] = SOURCE_OVERRIDE
+        rates.daily_prices.pop(offset, None)
+
+    return compiled
+
+
+def materialize_rates(rooms, start, end):
+    """Compile the rates of rooms for start..end and upsert them into NightlyRate
+
+    Returns the number of rows written.
+    """
+    rooms = list(rooms)
+    if not rooms or start >= end:
+        return 0
+    updated_at = timezone.now()
+    rows = []
+    for room_id, rates in compile_rates(rooms, start, end).items():
+        for offset, night in enumerate(rates.nights()):
+            rows.append(NightlyRate(
+                room_id=room_id,
+                date=night.date,
+                price=night.price,
+                currency=rates.room.currency,
+                source=night.source,
+                daily_price=night.daily_price,
+                updated_at=updated_at,
+            ))
+    NightlyRate.objects.bulk_create(
+        rows,
+        batch_size=NIGHTLY_RATE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['room', 'date'],
+        update_fields=['price', 'currency', 'source', 'daily_price', 'updated_at'],
+    )
+    return len(rows)
+
+
+def stored_rates(rooms, start, end):
+    """Return {room_id: RoomRates} read from NightlyRate, compiling stale rooms live
+
+    A room is compiled live when any of its nights has no row, or when a
+    pending NightlyRateRebuild overlaps the range.
+    """
+    rooms = list(rooms)
+    nights = (end - start).days
+    room_ids = [room.id for room in rooms]
+    stale = set(
+        NightlyRateRebuild.objects.filter(room_id__in=room_ids)
+        .filter(Q(start_date__isnull=True) | Q(start_date__lt=end))
+        .filter(Q(end_date__isnull=True) | Q(end_date__gt=start))
+        .values_list('room_id', flat=True)
+    )
+
+    rows = {}
+    if len(stale) < len(room_ids):
+        stored = NightlyRate.objects.filter(
+            room_id__in=[room_id for room_id in room_ids if room_id not in stale],
+            date__gte=start,
+            date__lt=end,
+        ).select_related('daily_price')
+        for row in stored:
+            rows.setdefault(row.room_id, []).append(row)
+
+    compiled = {}
+    for room in rooms:
+        room_rows = rows.get(room.id, [])
+        if room.id in stale or len(room_rows) != nights or any(row.currency != room.currency for row in room_rows):
+            continue
+        rates = RoomRates(
+            room,
+            start,
+            np.zeros(nights, dtype=np.int64),
+            np.zeros(nights, dtype=np.int8),
+            {},
+        )
+        for row in room_rows:
+            offset = (row.date - start).days
+            rates.amounts[offset] = to_cents(row.price)
+            rates.sources[offset] = SOURCE_CODES[row.source]
+            if row.daily_price:
+                rates.daily_prices[offset] = row.daily_price
+        compiled[room.id] = rates
+
+    missing = [room for room in rooms if room.id not in compiled]
+    if missing:
+        compiled.update(compile_rates(missing, start, end))
+    return compiled
+
+
+def nightly_prices(rooms, start, end):
+    """Return {room_id: [NightlyPrice, ...]} for each night from start up to end"""
+    return {room_id: rates.nights() for room_id, rates in stored_rates(rooms, start, end).items()}
+
+
+def total_price(breakdown):
+    """Sum the prices of a nightly breakdown"""
+    return sum((night.price for night in breakdown), Decimal('0.00'))
+
+
+def nightly_price_matrix(rooms, start, end):
+    """Return a (rooms x nights) int64 array of nightly prices in cents"""
+    rooms = list(rooms)
+    compiled = stored_rates(rooms, start, end)
+    if not rooms:
+        return np.zeros((0, (end - start).days), dtype=np.int64)
+    return np.vstack([compiled[room.id].amounts for room in rooms])
+
+
+def price_booking(booking):
+    """Price a new booking's stay with the engine
+
+    Sets the booking's currency, its average nightly `room_rate`, the exact
+    per-night amounts that Booking.save() sums into the subtotal, and the
+    mandatory fees and exclusive taxes of the room.
+    """
+    room = booking.room
+    rates = compile_rates([room], booking.check_in_date, booking.check_out_date)[room.id]
+    booking.currency = room.currency
+    booking.nightly_rates = [night.price for night in rates.nights()]
+    average = rates.total() / len(booking.nightly_rates)
+    booking.room_rate = average.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    charges = room_charges([room], {room.id: rates.total()})[room.id]
+    booking.fee_amount = charges.fee_amount
+    booking.tax_amount = charges.tax_amount
+    return rates
@@ -0,0 +1,78 @@
+"""
+Batch quotes: prices for many (room, check-in, check-out) stays at once.
+
+Rooms with their fees and taxes are loaded in one go. Stays are sorted by
+check-in and grouped into date windows of at most QUOTE_WINDOW_DAYS nights;
+the nightly rates of each window are read for all of its rooms together, so
+the number of queries depends on how spread out the dates are, not on how
+many stays are quoted. Availability comes from the shared bitmaps.
+"""
+from datetime import timedelta
+
+from rentals.models import Room
+from .availability import unavailable_stays
+from .charges import compute_charges
+from .pricing import stored_rates, from_cents
+
+QUOTE_WINDOW_DAYS = 62
+
+
+def _windows(stays):
+    """Group stay positions into (start, end, positions) windows"""
+    windows = []
+    order = sorted(range(len(stays)), key=lambda position: stays[position][1])
+    for position in order:
+        _, check_in, check_out = stays[position]
+        if windows:
+            start, end, positions = windows[-1]
+            if (max(end, check_out) - start).days <= QUOTE_WINDOW_DAYS:
+                windows[-1] = (start, max(end, check_out), positions + [position])
+                continue
+        windows.append((check_in, check_out, [position]))
+    return windows
+
+
+def quote_stays(stays):
+    """Quote a list of (room_id, check_in, check_out) stays
+
+    Returns one dict per stay, in the same order. Unknown or inactive rooms
+    get an `error` instead of prices.
+    """
+    rooms = Room.objects.filter(
+        id__in={room_id for room_id, _, _ in stays}, is_active=True
+    ).prefetch_related('fees', 'taxes').in_bulk()
+    known = [position for position, (room_id, _, _) in enumerate(stays) if room_id in rooms]
+    taken = unavailable_stays([stays[position] for position in known])
+    taken = {known[index] for index in taken}
+
+    quotes = [{'room': str(room_id), 'checkin': str(check_in), 'checkout': str(check_out)} for room_id, check_in, check_out in stays]
+    for position, (room_id, _, _) in enumerate(stays):
+        if room_id not in rooms:
+            quotes[position]['error'] = 'Room not found.'
+
+    for start, end, positions in _windows([stays[position] for position in known]):
+        positions = [known[index] for index in positions]
+        window_rooms = {stays[position][0]: rooms[stays[position][0]] for position in positions}
+        compiled = stored_rates(window_rooms.values(), start, end)
+        for position in positions:
+            room_id, check_in, check_out = stays[position]
+            room = rooms[room_id]
+            rates = compiled[room_id]
+            first, last = (check_in - start).days, (check_out - start).days
+            subtotal = from_cents(rates.amounts[first:last].sum())
+            charges = compute_charges(subtotal, room.fees.all(), room.taxes.all())
+            quotes[position].update({
+                'available': position not in taken,
+                'nights': last - first,
+                'currency': room.currency,
+                'subtotal': float(charges.subtotal),
+                'fee_amount': float(charges.fee_amount),
+                'tax_amount': float(charges.tax_amount),
+                'total_price': float(charges.total),
+                'price_breakdown': [
+                    {'date': str(start + timedelta(days=offset)), 'price': float(from_cents(rates.amounts[offset]))}
+                    for offset in range(first, last)
+                ],
+                'charges': charges.breakdown(),
+            })
+    return quotes
@@ -0,0 +1,87 @@
+"""
+Booking references: short, readable and unique without retries.
+
+Each process reserves a block of REFERENCE_BLOCK_SIZE sequence numbers by
+inserting one BookingReferenceBlock row; the row's id is the block number.
+Database id sequences never hand out the same value twice, even when the
+inserting transaction rolls back, so two processes can never share a block.
+References inside a block are handed out from memory, so only one booking
+in REFERENCE_BLOCK_SIZE costs a query.
+
+The sequence number is written in Crockford base32 (digits and capitals
+without I, L, O and U), padded to REFERENCE_DIGITS, after a fixed prefix:
+BK0000Z4M. Old references (prefix, date and random letters) are longer, so
+the two formats can never collide.
+
+On SQLite, id sequences roll back with the transaction; there a block
+reserved by a rolled-back transaction can be reused, which only matters in
+development.
+"""
+import os
+import re
+import threading
+
+from .models import BookingReferenceBlock
+
+REFERENCE_PREFIX = 'BK'
+REFERENCE_BLOCK_SIZE = 1000
+REFERENCE_DIGITS = 7
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+# Anything that could be a generated reference, look-alike letters included
+GENERATED_REFERENCE = re.compile(rf'{REFERENCE_PREFIX}[0-9A-Z]{{{REFERENCE_DIGITS}}}')
+
+
+def encode_base32(number, digits=REFERENCE_DIGITS):
+    """Encode a non-negative integer in Crockford base32, zero-padded to `digits`"""
+    encoded = []
+    while number:
+        number, remainder = divmod(number, 32)
+        encoded.append(CROCKFORD_ALPHABET[remainder])
+    return ''.join(reversed(encoded)).rjust(digits, '0')
+
+
+def is_generated_reference(reference):
+    """Whether a reference has the format of the ones handed out here"""
+    return bool(GENERATED_REFERENCE.fullmatch(reference))
+
+
+def decode_base32(text):
+    """Decode Crockford base32, accepting lower case and the usual look-alikes"""
+    text = text.upper().replace('-', '').translate(str.maketrans('OIL', '011'))
+    number = 0
+    for character in text:
+        number = number * 32 + CROCKFORD_ALPHABET.index(character)
+    return number
+
+
+class ReferenceAllocator:
+    """Hands out sequence numbers from blocks reserved in the database"""
+
+    def __init__(self, block_size=REFERENCE_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = None
+
+    def _reserve_block(self):
+        block = BookingReferenceBlock.objects.create()
+        self._next = block.pk * self.block_size
+        self._end = self._next + self.block_size
+        self._pid = os.getpid()
+
+    def next_number(self):
+        with self._lock:
+            # A forked worker must not reuse its parent's block
+            if self._next >= self._end or self._pid != os.getpid():
+                self._reserve_block()
+            number = self._next
+            self._next += 1
+            return number
+
+
+_allocator = ReferenceAllocator()
+
+
+def next_booking_reference():
+    """Return a new unique booking reference such as BK0000Z4M"""
+    return REFERENCE_PREFIX + encode_base32(_allocator.next_number())
@@ -1,10 +1,58 @@
-from rest_framework import serializers
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
 from .models import Booking, Payment, DailyRoomPrice, ExchangeRate
+from .pricing import price_booking
+from .holds import hold_booking, RoomUnavailable
+
+class StayConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The room is not available for these dates.'
+    default_code = 'stay_conflict'
 
 class BookingSerializer(serializers.ModelSerializer):
+    hold_expires_at = serializers.SerializerMethodField()
+
     class Meta:
         model = Booking
         fields = '__all__'
+        # Pricing, status and staff fields are set by the server, never by the guest
+        read_only_fields = [
+            'booking_reference', 'hotel', 'guest', 'nights', 'room_rate', 'subtotal', 'tax_amount', 'fee_amount',
+            'discount_amount', 'total_amount', 'currency', 'status', 'internal_notes', 'actual_check_in',
+            'actual_check_out', 'checked_in_by', 'checked_out_by', 'confirmed_at', 'cancelled_at',
+        ]
+
+    def get_hold_expires_at(self, obj):
+        """When the unpaid booking's nights are released, or None once they are kept for good"""
+        if not hasattr(obj, 'hold_expires_at'):
+            obj.hold_expires_at = obj.holds.exclude(expires_at__isnull=True).values_list('expires_at', flat=True).first()
+        return obj.hold_expires_at
+
+    def validate(self, attrs):
+        check_in = attrs.get('check_in_date', getattr(self.instance, 'check_in_date', None))
+        check_out = attrs.get('check_out_date', getattr(self.instance, 'check_out_date', None))
+        if check_in and check_out and check_in >= check_out:
+            raise serializers.ValidationError({'check_out_date': 'Check-out must be after check-in.'})
+        return attrs
+
+    def create(self, validated_data):
+        # New bookings wait for payment or staff to be confirmed
+        validated_data['status'] = 'pending'
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            validated_data['guest'] = request.user
+        # Price the stay with the same engine that quotes rooms in search
+        booking = Booking(**validated_data)
+        price_booking(booking)
+        try:
+            with transaction.atomic():
+                booking.save()
+                # Holds the room-nights; a concurrent overlapping checkout fails here
+                booking.hold_expires_at = hold_booking(booking)
+        except RoomUnavailable as error:
+            raise StayConflict(str(error))
+        return booking
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -25,4 +73,45 @@ class DailyRoomPriceSerializer(serializers.ModelSerializer):
 
     def get_rate_used(self, obj):
         # Assumes obj has a rate_used attribute or property set in the queryset or view
-        return getattr(obj, 'rate_used', None)
\ No newline at end of file
+        return getattr(obj, 'rate_used', None)
+class QuoteStaySerializer(serializers.Serializer):
+    """One (room, checkin, checkout) stay of a batch quote request"""
+    MAX_NIGHTS = 365
+
+    room = serializers.UUIDField()
+    checkin = serializers.DateField()
+    checkout = serializers.DateField()
+
+    def validate(self, attrs):
+        nights = (attrs['checkout'] - attrs['checkin']).days
+        if nights < 1:
+            raise serializers.ValidationError({'checkout': 'Checkout must be after checkin.'})
+        if nights > self.MAX_NIGHTS:
+            raise serializers.ValidationError({'checkout': f'A stay can be at most {self.MAX_NIGHTS} nights.'})
+        return attrs
+
+class DailyPriceRangeSerializer(serializers.Serializer):
+    """A fixed price or a percentage change for a date range across rooms"""
+    MAX_ROOMS = 200
+    MAX_NIGHTS = 366
+
+    rooms = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=MAX_ROOMS)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField(help_text="Last night to update (inclusive)")
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    percent = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=-99, required=False)
+    currency = serializers.CharField(min_length=3, max_length=3, required=False)
+
+    def validate(self, attrs):
+        if ('price' in attrs) == ('percent' in attrs):
+            raise serializers.ValidationError('Give either a price or a percent change.')
+        if 'currency' in attrs and 'percent' in attrs:
+            raise serializers.ValidationError({'currency': 'A percent change keeps each room\'s currency.'})
+        nights = (attrs['end_date'] - attrs['start_date']).days + 1
+        if nights < 1:
+            raise serializers.ValidationError({'end_date': 'End date must not be before start date.'})
+        if nights > self.MAX_NIGHTS:
+            raise serializers.ValidationError({'end_date': f'The range can be at most {self.MAX_NIGHTS} nights.'})
+        if 'currency' in attrs:
+            attrs['currency'] = attrs['currency'].upper()
+        return attrs
@@ -0,0 +1,641 @@
+import csv
+import random
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import QuerySet
+from django.forms.models import model_to_dict
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from rentals.models import Rental, Room, RoomAvailability, RoomFee, RoomTax
+from users.models import CustomUser, Hotel
+
+from . import exchange
+from .availability import AVAILABILITY_HORIZON_DAYS, unavailable_room_ids
+from .charges import compute_charges
+from .holds import RoomUnavailable, hold_booking, hold_ttl, release_expired
+from .daily_prices import import_kes_prices
+from .imports import import_bookings
+from .lifecycle import EXPIRED_NOTE, TRANSITIONS, sweep_bookings, sweeper_stats
+from .models import Booking, DailyRoomPrice, ExchangeRate, Payment, RoomNightHold
+from .pricing import price_booking
+
+
+def make_rental(slug, rooms):
+    """Create a hotel with one rental of `rooms` rooms; return (rental, rooms)"""
+    owner = CustomUser.objects.create(username=f'owner-{slug}')
+    hotel = Hotel.objects.create(
+        name=f'Hotel {slug}', slug=f'hotel-{slug}', email=f'{slug}@example.com', phone='+254712345678',
+        address='Kenyatta Avenue', city='Nairobi', country='Kenya',
+    )
+    rental = Rental.objects.create(
+        hotel=hotel, owner=owner, title=f'Rental {slug}', description='A rental', price_per_night=Decimal('100'),
+        location='Nairobi', slug=slug,
+    )
+    return rental, [
+        Room.objects.create(
+            hotel=hotel, rental=rental, name=f'Room {number:02d}', room_type='standard', description='A room',
+            max_occupancy=2, bed_type='double', bathroom_type='private', base_price=Decimal('100.00') + number,
+        )
+        for number in range(rooms)
+    ]
+
+
+def book(room, check_in, check_out, status='confirmed'):
+    return Booking.objects.create(
+        room=room, hotel=room.hotel, guest_name='Guest', guest_email='guest@example.com', guest_phone='+254700000000',
+        check_in_date=check_in, check_out_date=check_out, room_rate=room.base_price, status=status,
+    )
+
+
+class AvailabilityQueryCountTests(TestCase):
+    """Availability costs the same number of queries however many rooms a rental has"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.check_in = timezone.localdate() + timedelta(days=10)
+        cls.check_out = cls.check_in + timedelta(days=3)
+        cls.small, cls.small_rooms = make_rental('small', 3)
+        cls.large, cls.large_rooms = make_rental('large', 30)
+        for rooms in (cls.small_rooms, cls.large_rooms):
+            book(rooms[0], cls.check_in, cls.check_out)
+            book(rooms[1], cls.check_in - timedelta(days=2), cls.check_in + timedelta(days=1), status='pending')
+            book(rooms[2], cls.check_in, cls.check_out, status='cancelled')
+
+    def setUp(self):
+        cache.clear()
+        # Exchange rates are loaded once per process, not per request
+        exchange.fingerprint()
+
+    def count_queries(self, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            result = func(*args, **kwargs)
+        return len(context), result
+
+    def test_unavailable_room_ids(self):
+        for rooms in (self.small_rooms, self.large_rooms):
+            room_ids = [room.id for room in rooms]
+            # Bookings and blocked days are loaded once for every room
+            with self.assertNumQueries(2):
+                taken = unavailable_room_ids(room_ids, self.check_in, self.check_out)
+            self.assertEqual(taken, {rooms[0].id, rooms[1].id})
+            # Then the cached bitmaps answer without the database
+            with self.assertNumQueries(0):
+                unavailable_room_ids(room_ids, self.check_in, self.check_out)
+
+    def test_unavailable_room_ids_beyond_horizon(self):
+        check_in = timezone.localdate() + timedelta(days=AVAILABILITY_HORIZON_DAYS + 10)
+        book(self.large_rooms[3], check_in, check_in + timedelta(days=2))
+        for rooms in (self.small_rooms, self.large_rooms):
+            with self.assertNumQueries(2):
+                taken = unavailable_room_ids([room.id for room in rooms], check_in, check_in + timedelta(days=2))
+        self.assertEqual(taken, {self.large_rooms[3].id})
+
+    def test_room_list_query_count_is_flat(self):
+        params = {'checkin': self.check_in.isoformat(), 'checkout': self.check_out.isoformat()}
+        small, response = self.count_queries(self.client.get, f'/api/rentals/{self.small.slug}/rooms/', params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        cache.clear()
+        exchange.fingerprint()
+        large, response = self.count_queries(self.client.get, f'/api/rentals/{self.large.slug}/rooms/', params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 20)
+        self.assertEqual(small, large)
+
+
+class BookingImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('import', 2)
+        cls.user = CustomUser.objects.create(username='admin', role='super_admin')
+        cls.check_in = timezone.localdate() + timedelta(days=30)
+
+    def row(self, number, **fields):
+        check_in = self.check_in + timedelta(days=3 * number)
+        return dict({
+            'room': str(self.rooms[0].id), 'check_in_date': check_in.isoformat(),
+            'check_out_date': (check_in + timedelta(days=2)).isoformat(), 'guest_name': f'Guest {number}',
+            'guest_email': 'guest@example.com', 'guest_phone': '+254700000000', 'room_rate': '100.00',
+        }, **fields)
+
+    def test_generated_reference_format_is_rejected(self):
+        rows = [
+            (1, self.row(1, booking_reference='bk0000z4m')),
+            (2, self.row(2, booking_reference='PMS-1042')),
+        ]
+        result = import_bookings(rows)
+        self.assertEqual(result.written, 1)
+        self.assertEqual([line for line, _ in result.errors], [1])
+        self.assertTrue(Booking.objects.filter(booking_reference='PMS-1042').exists())
+
+    def test_status_defaults_to_where_the_stay_is(self):
+        today = timezone.localdate()
+        rows = [
+            (1, self.row(1, check_in_date=str(today - timedelta(days=400)), check_out_date=str(today - timedelta(days=397)))),
+            (2, self.row(2, check_in_date=str(today - timedelta(days=1)), check_out_date=str(today + timedelta(days=1)))),
+            (3, self.row(3)),
+            (4, self.row(4, check_in_date=str(today - timedelta(days=30)), check_out_date=str(today - timedelta(days=28)), status='cancelled')),
+        ]
+        self.assertEqual(import_bookings(rows).written, 4)
+        self.assertEqual(
+            list(Booking.objects.order_by('check_in_date').values_list('guest_name', 'status')),
+            [('Guest 1', 'checked_out'), ('Guest 4', 'cancelled'), ('Guest 2', 'checked_in'), ('Guest 3', 'confirmed')],
+        )
+
+    def test_unreadable_upload_reports_rows_written(self):
+        header = 'room,check_in_date,check_out_date,guest_name,guest_email,guest_phone,room_rate\n'
+        lines = [','.join(self.row(number).values()) + '\n' for number in range(3)]
+        content = (header + lines[0] + lines[1]).encode() + b'\xff\xfe broken\n' + lines[2].encode()
+        self.client.force_login(self.user)
+        response = self.client.post(
+            '/api/bookings/import/', {'file': SimpleUploadedFile('bookings.csv', content, 'text/csv')}, secure=True,
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['written'], 2)
+        self.assertIn('line 3', response.json()['detail'])
+        self.assertEqual(Booking.objects.count(), 2)
+
+
+class BookingCreateAPITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('checkout', 1)
+        cls.user = CustomUser.objects.create(username='guest')
+        cls.check_in = timezone.localdate() + timedelta(days=20)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def post(self, **fields):
+        data = dict({
+            'room': str(self.rooms[0].id), 'check_in_date': self.check_in.isoformat(),
+            'check_out_date': (self.check_in + timedelta(days=2)).isoformat(), 'guest_name': 'Guest',
+            'guest_email': 'guest@example.com', 'guest_phone': '+254700000000',
+        }, **fields)
+        return self.client.post('/api/bookings/', data, secure=True)
+
+    def test_guest_cannot_set_status_or_prices(self):
+        response = self.post(status='confirmed', discount_amount='150', internal_notes='VIP', confirmed_at=timezone.now().isoformat())
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['status'], 'pending')
+        self.assertIsNotNone(data['hold_expires_at'])
+        self.assertEqual(Decimal(data['discount_amount']), 0)
+        self.assertEqual(Decimal(data['total_amount']), Decimal('200.00'))
+        self.assertEqual(data['internal_notes'], '')
+        self.assertIsNone(data['confirmed_at'])
+        self.assertEqual(data['guest'], self.user.id)
+
+    def test_overlapping_booking_conflicts(self):
+        self.assertEqual(self.post().status_code, 201)
+        response = self.post(check_in_date=(self.check_in + timedelta(days=1)).isoformat(), check_out_date=(self.check_in + timedelta(days=4)).isoformat())
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class BookingAdminConflictTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('admin', 2)
+        cls.admin = CustomUser.objects.create(username='staff', is_staff=True, is_superuser=True)
+        cls.check_in = timezone.localdate() + timedelta(days=20)
+        cls.taken = book(cls.rooms[0], cls.check_in, cls.check_in + timedelta(days=3))
+        cls.booking = book(cls.rooms[1], cls.check_in, cls.check_in + timedelta(days=3))
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def change(self, booking, **fields):
+        """Post the admin change form of a booking with some fields changed"""
+        request = RequestFactory().get('/')
+        request.user = self.admin
+        form = admin.site._registry[Booking].get_form(request, booking)
+        data = {name: value for name, value in model_to_dict(booking, fields=form.base_fields).items() if value is not None}
+        data.update(fields, _save='Save')
+        return self.client.post(reverse('admin:bookings_booking_change', args=[booking.pk]), data, secure=True)
+
+    def test_moving_onto_taken_nights_is_a_form_error(self):
+        response = self.change(self.booking, room=self.rooms[0].pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'The room is already booked for some of these nights.')
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.room_id, self.rooms[1].id)
+
+    def test_reactivating_onto_taken_nights_is_a_form_error(self):
+        cancelled = book(self.rooms[0], self.check_in + timedelta(days=1), self.check_in + timedelta(days=2), status='cancelled')
+        response = self.change(cancelled, status='confirmed')
+        self.assertContains(response, 'The room is already booked for some of these nights.')
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, 'cancelled')
+
+    def test_moving_onto_free_nights_moves_the_holds(self):
+        check_in = self.check_in + timedelta(days=5)
+        response = self.change(self.booking, room=self.rooms[0].pk, check_in_date=check_in, check_out_date=check_in + timedelta(days=2))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(RoomNightHold.objects.filter(booking=self.booking).values_list('room_id', 'date')),
+            [(self.rooms[0].id, check_in), (self.rooms[0].id, check_in + timedelta(days=1))],
+        )
+
+
+class RoomNightHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('holds', 2)
+        cls.check_in = timezone.localdate() + timedelta(days=20)
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+
+    def checkout(self, check_in=None, nights=2, status='pending', room=None):
+        """Create a booking and hold its nights, as the booking API does"""
+        check_in = check_in or self.check_in
+        with transaction.atomic():
+            booking = book(room or self.rooms[0], check_in, check_in + timedelta(days=nights), status=status)
+            hold_booking(booking)
+        return booking
+
+    def held(self, booking):
+        return list(RoomNightHold.objects.filter(booking=booking).values_list('room_id', 'date', 'expires_at'))
+
+    def test_pending_holds_expire_and_confirmed_ones_do_not(self):
+        pending = self.checkout()
+        confirmed = self.checkout(self.check_in + timedelta(days=5), status='confirmed')
+        expiry = {expires_at for _, _, expires_at in self.held(pending)}
+        self.assertEqual(len(expiry), 1)
+        self.assertAlmostEqual(expiry.pop(), self.now + hold_ttl(), delta=timedelta(seconds=5))
+        self.assertEqual(len(self.held(pending)), 2)
+        self.assertEqual([expires_at for _, _, expires_at in self.held(confirmed)], [None, None])
+
+    def test_taken_nights_are_refused(self):
+        self.checkout()
+        with self.assertRaises(RoomUnavailable):
+            self.checkout(self.check_in + timedelta(days=1))
+        # Another room is free for the same nights
+        self.checkout(room=self.rooms[1])
+        RoomAvailability.objects.create(room=self.rooms[1], date=self.check_in + timedelta(days=6), status='blocked')
+        with self.assertRaisesMessage(RoomUnavailable, 'blocked'):
+            self.checkout(self.check_in + timedelta(days=5), room=self.rooms[1])
+
+    def test_release_expired(self):
+        unpaid = self.checkout()
+        paid = self.checkout(self.check_in + timedelta(days=5))
+        Payment.objects.create(booking=paid, amount=paid.total_amount, payment_method='mpesa', status='completed')
+        later = self.now + hold_ttl() + timedelta(minutes=1)
+        self.assertEqual(release_expired(now=self.now), 0)
+        self.assertEqual(release_expired(now=later), 1)
+        unpaid.refresh_from_db()
+        self.assertEqual(unpaid.status, 'cancelled')
+        self.assertIn('Hold expired', unpaid.internal_notes)
+        self.assertEqual(self.held(unpaid), [])
+        # The paid booking's holds were made permanent when it was paid
+        self.assertEqual(len(self.held(paid)), 2)
+
+    def test_release_expired_in_batches(self):
+        bookings = [self.checkout(self.check_in + timedelta(days=3 * number), nights=1) for number in range(5)]
+        self.assertEqual(release_expired(now=self.now + hold_ttl() + timedelta(minutes=1), batch_size=2), 5)
+        self.assertFalse(RoomNightHold.objects.filter(booking__in=bookings).exists())
+
+    def test_expired_holds_do_not_block_a_new_checkout(self):
+        unpaid = self.checkout()
+        RoomNightHold.objects.filter(booking=unpaid).update(expires_at=self.now - timedelta(minutes=1))
+        booking = self.checkout(self.check_in + timedelta(days=1))
+        unpaid.refresh_from_db()
+        self.assertEqual(unpaid.status, 'cancelled')
+        self.assertEqual(len(self.held(booking)), 2)
+
+    def test_cancelling_releases_the_holds(self):
+        booking = self.checkout()
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.held(booking), [])
+        self.checkout()
+
+    def test_move_holds_with_the_booking(self):
+        booking = self.checkout()
+        expires_at = self.held(booking)[0][2]
+        booking.room = self.rooms[1]
+        booking.check_in_date += timedelta(days=1)
+        booking.check_out_date += timedelta(days=2)
+        booking.save()
+        self.assertEqual(self.held(booking), [
+            (self.rooms[1].id, booking.check_in_date + timedelta(days=night), expires_at) for night in range(3)
+        ])
+        # The nights it left are free again
+        self.checkout()
+
+    def test_move_onto_taken_nights_changes_nothing(self):
+        booking = self.checkout()
+        self.checkout(self.check_in + timedelta(days=5))
+        held = self.held(booking)
+        booking.check_in_date += timedelta(days=4)
+        booking.check_out_date += timedelta(days=4)
+        with self.assertRaises(RoomUnavailable):
+            booking.save()
+        booking.refresh_from_db()
+        self.assertEqual(booking.check_in_date, self.check_in)
+        self.assertEqual(self.held(booking), held)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs row locks and concurrent transactions (PostgreSQL)')
+class ConcurrentHoldTests(TransactionTestCase):
+    """Many threads booking overlapping stays of one room never commit a double booking"""
+    threads = 12
+    attempts = 5
+
+    def test_no_double_booking(self):
+        _, rooms = make_rental('hammer', 1)
+        room = rooms[0]
+        start = timezone.localdate() + timedelta(days=30)
+        outcomes = []
+        barrier = threading.Barrier(self.threads)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                barrier.wait()
+                for _ in range(self.attempts):
+                    check_in = start + timedelta(days=rng.randrange(10))
+                    booking = Booking(
+                        room=room, guest_name='Guest', guest_email='guest@example.com', guest_phone='+254700000000',
+                        check_in_date=check_in, check_out_date=check_in + timedelta(days=rng.randint(1, 3)),
+                    )
+                    price_booking(booking)
+                    try:
+                        with transaction.atomic():
+                            booking.save()
+                            hold_booking(booking)
+                        outcomes.append('booked')
+                    except RoomUnavailable:
+                        outcomes.append('conflict')
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(len(outcomes), self.threads * self.attempts)
+        self.assertIn('booked', outcomes)
+        stays = list(
+            Booking.objects.filter(room=room, status__in=Booking.BLOCKING_STATUSES)
+            .order_by('check_in_date').values_list('check_in_date', 'check_out_date')
+        )
+        self.assertEqual(len(stays), outcomes.count('booked'))
+        for previous, current in zip(stays, stays[1:]):
+            self.assertLessEqual(previous[1], current[0])
+        self.assertEqual(RoomNightHold.objects.filter(room=room).count(), sum((end - start).days for start, end in stays))
+
+
+class BookingSweeperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('sweeper', 3)
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+
+    def booking(self, check_in, nights=2, status='confirmed', created_hours_ago=0, room=0):
+        booking = book(self.rooms[room], self.today + timedelta(days=check_in), self.today + timedelta(days=check_in + nights), status=status)
+        Booking.objects.filter(pk=booking.pk).update(created_at=self.now - timedelta(hours=created_hours_ago))
+        return booking
+
+    def statuses(self, *bookings):
+        return [Booking.objects.get(pk=booking.pk).status for booking in bookings]
+
+    def test_transitions(self):
+        paid = self.booking(10, status='pending')
+        Payment.objects.create(booking=paid, amount=paid.total_amount, payment_method='mpesa', status='completed')
+        stale = self.booking(20, status='pending', created_hours_ago=49)
+        recent = self.booking(30, status='pending', created_hours_ago=47)
+        no_show = self.booking(-2, room=1)
+        arriving = self.booking(0, room=2)
+        old_history = self.booking(-30, room=1)
+        leaving = self.booking(-3, nights=2, status='checked_in', room=2)
+        staying = self.booking(-1, nights=1, status='checked_in', room=0)
+
+        counters = sweep_bookings(now=self.now)
+        self.assertEqual(counters, {'confirmed': 1, 'hold_expired': 0, 'expired': 1, 'no_show': 1, 'checked_out': 1})
+        self.assertEqual(
+            self.statuses(paid, stale, recent, no_show, arriving, old_history, leaving, staying),
+            ['confirmed', 'cancelled', 'pending', 'no_show', 'confirmed', 'confirmed', 'checked_out', 'checked_in'],
+        )
+        stale.refresh_from_db()
+        self.assertEqual(stale.internal_notes, EXPIRED_NOTE)
+        self.assertIsNotNone(stale.cancelled_at)
+        self.assertEqual(sweep_bookings(now=self.now), dict.fromkeys(TRANSITIONS, 0))
+
+    def test_dry_run_counts_without_writing(self):
+        stale = self.booking(20, status='pending', created_hours_ago=49)
+        no_show = self.booking(-2, room=1)
+        counters = sweep_bookings(now=self.now, dry_run=True)
+        self.assertEqual(counters, {'confirmed': 0, 'hold_expired': 0, 'expired': 1, 'no_show': 1, 'checked_out': 0})
+        self.assertEqual(self.statuses(stale, no_show), ['pending', 'confirmed'])
+        self.assertIsNone(sweeper_stats()['last_run'])
+
+    def test_batches(self):
+        stale = [self.booking(3 * number, nights=1, status='pending', created_hours_ago=72) for number in range(5)]
+        with CaptureQueriesContext(connection) as context:
+            counters = sweep_bookings(now=self.now, batch_size=2)
+        self.assertEqual(counters['expired'], 5)
+        self.assertEqual(self.statuses(*stale), ['cancelled'] * 5)
+        # Three batches of at most two bookings: 2, 2 and 1
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "bookings_booking"')]
+        self.assertEqual(len(updates), 3)
+
+    def test_staff_change_during_sweep_is_left_alone(self):
+        stale = self.booking(20, status='pending', created_hours_ago=49)
+        other = self.booking(30, status='pending', created_hours_ago=49, room=1)
+        update = QuerySet.update
+
+        def staff_confirms_first(queryset, **changes):
+            # Staff confirm a booking between the sweeper's select and its update
+            if queryset.model is Booking and changes.get('status') == 'cancelled':
+                update(Booking.objects.filter(pk=other.pk), status='confirmed')
+            return update(queryset, **changes)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=staff_confirms_first):
+            counters = sweep_bookings(now=self.now)
+        self.assertEqual(counters['expired'], 1)
+        self.assertEqual(self.statuses(stale, other), ['cancelled', 'confirmed'])
+
+    def test_holds_released(self):
+        no_show = self.booking(-2)
+        leaving = self.booking(-3, nights=2, status='checked_in', room=1)
+        future = self.booking(10, room=2)
+        for booking in (no_show, leaving, future):
+            with transaction.atomic():
+                RoomNightHold.objects.bulk_create(
+                    RoomNightHold(room_id=booking.room_id, date=booking.check_in_date + timedelta(days=night), booking=booking)
+                    for night in range(booking.nights)
+                )
+        sweep_bookings(now=self.now)
+        self.assertEqual(
+            set(RoomNightHold.objects.values_list('booking_id', flat=True).distinct()), {future.pk},
+        )
+
+    def test_paid_bookings_are_confirmed_before_expired_holds_are_released(self):
+        paid = self.booking(10, status='pending')
+        unpaid = self.booking(20, status='pending', room=1)
+        for booking in (paid, unpaid):
+            hold_booking(booking)
+        RoomNightHold.objects.update(expires_at=self.now - timedelta(minutes=1))
+        # Recorded without signals, e.g. by a payment gateway callback using update()
+        Payment.objects.bulk_create([Payment(booking=paid, amount=paid.total_amount, payment_method='mpesa', status='completed')])
+
+        counters = sweep_bookings(now=self.now)
+        self.assertEqual((counters['confirmed'], counters['hold_expired']), (1, 1))
+        self.assertEqual(self.statuses(paid, unpaid), ['confirmed', 'cancelled'])
+        self.assertEqual(set(RoomNightHold.objects.values_list('booking_id', 'expires_at')), {(paid.pk, None)})
+
+    def test_counters(self):
+        self.booking(-2)
+        sweep_bookings(now=self.now)
+        self.booking(-3, room=1)
+        self.booking(-4, nights=1, status='checked_in', room=2)
+        sweep_bookings(now=self.now)
+        stats = sweeper_stats()
+        self.assertEqual({name: stats[name] for name in TRANSITIONS}, {'confirmed': 0, 'hold_expired': 0, 'expired': 0, 'no_show': 2, 'checked_out': 1})
+        self.assertAlmostEqual(stats['last_run'], timezone.now().timestamp(), delta=5)
+
+
+class KesPriceImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('kes-import', 1)
+        cls.admin = CustomUser.objects.create(username='prices', is_staff=True, is_superuser=True)
+        ExchangeRate.objects.create(from_currency='KES', to_currency='USD', rate=Decimal('100'))
+        cls.day = timezone.localdate() + timedelta(days=10)
+
+    def setUp(self):
+        cache.clear()
+        exchange.invalidate()
+
+    def lines(self, count):
+        return [f'{self.rooms[0].id},{self.day + timedelta(days=number)},10000\n' for number in range(count)]
+
+    def test_broken_csv_stops_after_writing_the_rows_before(self):
+        lines = ['room,date,kes_price\n'] + self.lines(2) + ['"' + 'x' * (csv.field_size_limit() + 1) + '"\n'] + self.lines(3)[2:]
+        result = import_kes_prices(iter(lines), batch_size=1)
+        self.assertEqual(result.written, 2)
+        self.assertIn('line 3', result.stopped)
+        self.assertEqual(DailyRoomPrice.objects.count(), 2)
+
+    def test_admin_upload_with_a_bad_byte_reports_rows_written(self):
+        content = ('room,date,kes_price\n' + ''.join(self.lines(2))).encode() + b'\xff\n' + self.lines(3)[2].encode()
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            reverse('admin:bookings_dailyroomprice_import_kes'),
+            {'csv_file': SimpleUploadedFile('prices.csv', content, 'text/csv')}, secure=True, follow=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Imported 2 daily prices')
+        self.assertContains(response, 'Could not read past line 3')
+        self.assertEqual(DailyRoomPrice.objects.count(), 2)
+
+
+class DailyPriceCalendarTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rental, cls.rooms = make_rental('calendar', 1)
+        cls.day = timezone.localdate() + timedelta(days=10)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, room_id, **headers):
+        params = {'room_id': room_id, 'start_date': self.day.isoformat(), 'end_date': (self.day + timedelta(days=2)).isoformat()}
+        return self.client.get('/api/daily-prices/', params, secure=True, headers=headers)
+
+    def test_room_id_spellings_share_the_change_stamp(self):
+        room_id = self.rooms[0].id
+        for spelling in (str(room_id).upper(), room_id.hex):
+            response = self.get(spelling)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.get(spelling, if_none_match=response['ETag']).status_code, 304)
+            with self.captureOnCommitCallbacks(execute=True):
+                DailyRoomPrice.objects.update_or_create(room=self.rooms[0], date=self.day, defaults={'price': Decimal(len(spelling))})
+            changed = self.get(spelling, if_none_match=response['ETag'])
+            self.assertEqual(changed.status_code, 200)
+            self.assertEqual(Decimal(changed.json()[0]['price']), len(spelling))
+
+    def test_malformed_room_id(self):
+        self.assertEqual(self.get('not-a-room').status_code, 400)
+
+
+class ChargeTests(TestCase):
+    fees = [
+        RoomFee(name='Cleaning', amount=Decimal('10.00')),
+        RoomFee(name='Service', amount=Decimal('5.00'), is_percentage=True),
+        RoomFee(name='Breakfast', amount=Decimal('30.00'), is_mandatory=False),
+    ]
+    taxes = [
+        RoomTax(name='VAT', rate=Decimal('16.00')),
+        RoomTax(name='Tourism levy', rate=Decimal('2.00'), is_inclusive=True),
+    ]
+
+    def test_compute_charges(self):
+        charges = compute_charges(Decimal('200.00'), self.fees, self.taxes)
+        # Percentage fees apply to the room subtotal; optional fees are listed but not charged
+        self.assertEqual(charges.fee_amount, Decimal('20.00'))
+        # Taxes apply to the subtotal plus mandatory fees; inclusive ones are not added again
+        self.assertEqual(charges.tax_amount, Decimal('35.20'))
+        self.assertEqual(charges.total, Decimal('255.20'))
+        self.assertEqual(
+            [(line.kind, line.name, line.amount, line.charged) for line in charges.lines],
+            [
+                ('fee', 'Cleaning', Decimal('10.00'), True),
+                ('fee', 'Service', Decimal('10.00'), True),
+                ('fee', 'Breakfast', Decimal('30.00'), False),
+                ('tax', 'VAT', Decimal('35.20'), True),
+                ('tax', 'Tourism levy', Decimal('4.31'), False),
+            ],
+        )
+
+    def test_lines_are_rounded_to_the_cent(self):
+        charges = compute_charges(Decimal('100.05'), [RoomFee(name='Service', amount=Decimal('12.5'), is_percentage=True)], [])
+        self.assertEqual(charges.fee_amount, Decimal('12.51'))
+        self.assertEqual(charges.total, Decimal('112.56'))
+
+    def test_without_fees_or_taxes(self):
+        charges = compute_charges(Decimal('99.99'), [], [])
+        self.assertEqual((charges.fee_amount, charges.tax_amount, charges.total, charges.lines), (0, 0, Decimal('99.99'), []))
+
+    def test_booking_amounts_match_the_quote(self):
+        rental, rooms = make_rental('charges', 1)
+        for fee in self.fees:
+            RoomFee.objects.create(room=rooms[0], name=fee.name, amount=fee.amount, is_percentage=fee.is_percentage, is_mandatory=fee.is_mandatory)
+        for tax in self.taxes:
+            RoomTax.objects.create(room=rooms[0], name=tax.name, rate=tax.rate, is_inclusive=tax.is_inclusive)
+        check_in = timezone.localdate() + timedelta(days=10)
+        stay = {'checkin': check_in.isoformat(), 'checkout': (check_in + timedelta(days=2)).isoformat()}
+        cache.clear()
+        quote = self.client.get(f'/api/rentals/{rental.slug}/rooms/', stay, secure=True).json()['results'][0]
+
+        self.client.force_login(CustomUser.objects.create(username='charged'))
+        booking = self.client.post('/api/bookings/', {
+            'room': str(rooms[0].id), 'check_in_date': stay['checkin'], 'check_out_date': stay['checkout'],
+            'guest_name': 'Guest', 'guest_email': 'guest@example.com', 'guest_phone': '+254700000000',
+        }, secure=True).json()
+        self.assertEqual(Decimal(booking['subtotal']), Decimal(str(quote['subtotal'])))
+        self.assertEqual(Decimal(booking['fee_amount']), Decimal(str(quote['fee_amount'])))
+        self.assertEqual(Decimal(booking['tax_amount']), Decimal(str(quote['tax_amount'])))
+        self.assertEqual(Decimal(booking['total_amount']), Decimal(str(quote['total_price'])))
+        self.assertEqual(Decimal(booking['total_amount']), Decimal('255.20'))
@@ -1,10 +1,14 @@
 from django.urls import path
-from .views import BookingCreateView, MpesaPaymentView, DailyRoomPriceListAPIView, MpesaSTKPushView, mpesa_callback, PaymentHistoryAPIView
+from .views import BookingCreateView, MpesaPaymentView, DailyRoomPriceListAPIView, MpesaSTKPushView, mpesa_callback, PaymentHistoryAPIView, BatchQuoteAPIView, BulkDailyRoomPriceAPIView, BookingImportAPIView, ExportAPIView
 
 urlpatterns = [
     path('bookings/', BookingCreateView.as_view(), name='booking-create'),
+    path('bookings/import/', BookingImportAPIView.as_view(), name='booking-import'),
     path('mpesa/pay/', MpesaPaymentView.as_view(), name='mpesa-pay'),
     path('daily-prices/', DailyRoomPriceListAPIView.as_view(), name='daily-room-prices'),
+    path('daily-prices/bulk/', BulkDailyRoomPriceAPIView.as_view(), name='daily-room-prices-bulk'),
+    path('exports/<slug:kind>.<slug:export_format>', ExportAPIView.as_view(), name='export'),
+    path('quotes/batch/', BatchQuoteAPIView.as_view(), name='batch-quotes'),
     path('mpesa/stkpush/', MpesaSTKPushView.as_view(), name='mpesa-stkpush'),
     path('mpesa/callback/', mpesa_callback, name='mpesa-callback'),
     path('payments/', PaymentHistoryAPIView.as_view(), name='payment-history'),
@@ -1,21 +1,35 @@
 import os
+import re
+import uuid
 import base64
 import requests
+import numpy as np
 from datetime import datetime, timedelta
+from decimal import Decimal
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.utils.dateparse import parse_date
-from .models import Booking, Payment, DailyRoomPrice, ExchangeRate
-from .serializers import BookingSerializer, PaymentSerializer, DailyRoomPriceSerializer
+from .models import Booking, Payment
+from .serializers import BookingSerializer, PaymentSerializer, DailyRoomPriceSerializer, QuoteStaySerializer, DailyPriceRangeSerializer
+from .pricing import stored_rates, to_cents, from_cents
+from .quotes import quote_stays
+from .daily_prices import set_daily_prices
+from .imports import csv_rows, import_bookings
+from .exports import EXPORTS, EXPORT_FORMATS, export_chunks, export_queryset
+from . import exchange
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rentals.cache import changed_at, make_etag, as_http_date
 from django.shortcuts import get_object_or_404
+from django.http import Http404, StreamingHttpResponse
 from rentals.models import Room
+from users.models import Hotel
 
 class BookingCreateView(generics.CreateAPIView):
     queryset = Booking.objects.all()
@@ -31,13 +45,35 @@ class MpesaPaymentView(generics.CreateAPIView):
         # Logic for M-Pesa STK Push goes here
         serializer.save()
 
-class BookingCreateAPIView(APIView):
-    def post(self, request):
-        return Response({'detail': 'Not implemented'}, status=501)
+def _calendar_currency(request):
+    """Explicit ?currency=, else the user's preferred currency, else USD"""
+    return (request.GET.get('currency') or getattr(request.user, 'preferred_currency', None) or 'USD').upper()
+
+def _room_id(request):
+    """The ?room_id= as the canonical UUID string change stamps are stored under, or None if missing or malformed"""
+    try:
+        return str(uuid.UUID(request.GET.get('room_id') or ''))
+    except ValueError:
+        return None
+
+def daily_prices_etag(request):
+    """ETag of a room's price calendar: the room's change stamp, the query, the currency and the exchange rates"""
+    room_id = _room_id(request)
+    if not room_id:
+        return None
+    return make_etag(changed_at('room', room_id), sorted(request.GET.lists()), _calendar_currency(request), exchange.fingerprint())
+
+def daily_prices_last_modified(request):
+    room_id = _room_id(request)
+    if not room_id:
+        return None
+    return as_http_date(max(changed_at('room', room_id), exchange.changed_at()))
 
 class DailyRoomPriceListAPIView(APIView):
     permission_classes = [permissions.AllowAny]
 
+    # Answers If-None-Match/If-Modified-Since with 304 before any pricing runs
+    @method_decorator(condition(etag_func=daily_prices_etag, last_modified_func=daily_prices_last_modified))
     def get(self, request):
         room_id = request.query_params.get('room_id')
         start_date = request.query_params.get('start_date')
@@ -48,57 +84,189 @@ class DailyRoomPriceListAPIView(APIView):
         logger.info(f"DailyRoomPriceListAPIView: room_id={room_id}, start_date={start_date}, end_date={end_date}")
         if not (room_id and start_date and end_date):
             return Response({'detail': 'room_id, start_date, and end_date are required.'}, status=400)
+        if not _room_id(request):
+            return Response({'detail': 'room_id must be a valid UUID.'}, status=400)
         try:
             start = parse_date(start_date)
             end = parse_date(end_date)
         except Exception:
             return Response({'detail': 'Invalid date format.'}, status=400)
-        # Fetch all prices in range
-        prices = DailyRoomPrice.objects.filter(room_id=room_id, date__range=[start, end])
-        price_map = {p.date: p for p in prices}
+        if not (start and end):
+            return Response({'detail': 'Invalid date format.'}, status=400)
         # Get the room base price
         from rentals.models import Room
         try:
             room = Room.objects.get(id=room_id)
         except Room.DoesNotExist:
             return Response({'detail': 'Room not found.'}, status=404)
-        # Get the latest exchange rate for the room's currency to USD
-        rate = None
-        try:
-            exchange_rate = ExchangeRate.objects.filter(
-                from_currency=room.currency, to_currency='USD'
-            ).order_by('-date').first()
-            if exchange_rate:
-                rate = float(exchange_rate.rate)
-        except Exception as e:
-            logger.error(f"Exchange rate lookup failed: {e}")
-            rate = None
-        # Generate all dates in range
-        days = (end - start).days + 1
+        requested = request.query_params.get('currency')
+        currency = _calendar_currency(request)
+        if not re.fullmatch(r'[A-Z]{3}', currency):
+            return Response({'detail': 'currency must be a 3-letter ISO code.'}, status=400)
+        # Fetch all prices in range (end_date is inclusive)
+        rates = stored_rates([room], start, end + timedelta(days=1))[room.id]
+        # Daily prices keep their own amount and currency; other nights are in the room's currency
+        cents = rates.amounts.copy()
+        currencies = np.full(len(cents), room.currency, dtype=object)
+        for offset, daily_price in rates.daily_prices.items():
+            cents[offset] = to_cents(daily_price.price)
+            currencies[offset] = daily_price.currency
+        # Convert the whole calendar, one vectorized pass per source currency
+        converted = cents.copy()
+        rate_used = np.full(len(cents), None, dtype=object)
+        output_currency = currencies.copy()
+        for source in set(currencies):
+            mask = currencies == source
+            try:
+                converted[mask] = exchange.convert_cents(cents[mask], source, currency)
+            except exchange.MissingExchangeRate:
+                if requested:
+                    return Response({'detail': f'No exchange rate from {source} to {currency}.'}, status=400)
+                # No rate for the default currency: return the prices unconverted
+                continue
+            output_currency[mask] = currency
+            if source.upper() != currency:
+                rate_used[mask] = str(exchange.get_rate(source, currency).quantize(Decimal('0.000001')))
         result = []
-        for i in range(days):
-            day = start + timedelta(days=i)
-            price_obj = price_map.get(day)
-            if price_obj:
+        for offset, night in enumerate(rates.nights()):
+            if night.daily_price:
                 # Use serializer for existing price
-                data = DailyRoomPriceSerializer(price_obj).data
+                data = DailyRoomPriceSerializer(night.daily_price).data
             else:
-                # Convert base price from room.currency to USD if rate is available
-                if rate and rate > 0:
-                    usd_price = float(room.base_price) / rate
-                    usd_price = round(usd_price, 2)
-                else:
-                    usd_price = float(room.base_price)
                 data = {
                     'id': None,
                     'room': room_id,  # Use as string/UUID, do not cast to int
-                    'date': day.isoformat(),
-                    'price': str(usd_price),  # USD
-                    'rate_used': str(rate) if rate else None
+                    'date': night.date.isoformat(),
                 }
+            data['price'] = str(from_cents(converted[offset]))
+            data['currency'] = output_currency[offset]
+            data['rate_used'] = rate_used[offset]
             result.append(data)
         return Response(result)
 
+class BulkDailyRoomPriceAPIView(APIView):
+    """Set a price, or a percentage change, for a date range across many rooms"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = DailyPriceRangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        rooms = Room.objects.filter(id__in=data['rooms'])
+        if not getattr(request.user, 'is_super_admin', False):
+            # Hotel users may only price their own hotel's rooms
+            rooms = rooms.filter(hotel=request.user.hotel) if request.user.hotel_id else rooms.none()
+        rooms = list(rooms)
+        missing = set(data['rooms']) - {room.id for room in rooms}
+        if missing:
+            return Response({'rooms': [f'Room {room_id} not found.' for room_id in sorted(map(str, missing))]}, status=status.HTTP_400_BAD_REQUEST)
+        written = set_daily_prices(
+            rooms,
+            data['start_date'],
+            data['end_date'] + timedelta(days=1),
+            price=data.get('price'),
+            percent=data.get('percent'),
+            currency=data.get('currency'),
+        )
+        return Response({'rooms': len(rooms), 'written': written})
+
+class BatchQuoteAPIView(APIView):
+    """Price many (room, checkin, checkout) stays in one request"""
+    permission_classes = [permissions.AllowAny]
+    max_stays = 500
+
+    def post(self, request):
+        stays = request.data.get('stays') if isinstance(request.data, dict) else None
+        if not isinstance(stays, list) or not stays:
+            return Response({'detail': 'stays must be a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(stays) > self.max_stays:
+            return Response({'detail': f'At most {self.max_stays} stays can be quoted at once.'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = QuoteStaySerializer(data=stays, many=True)
+        if not serializer.is_valid():
+            return Response({'stays': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        quotes = quote_stays([(stay['room'], stay['checkin'], stay['checkout']) for stay in serializer.validated_data])
+        return Response({'quotes': quotes})
+
+class BookingImportAPIView(APIView):
+    """Import bookings from another PMS, as a CSV upload (`file`) or a JSON list (`bookings`)"""
+    permission_classes = [IsAuthenticated]
+    max_json_rows = 5000
+
+    def post(self, request):
+        rooms = Room.objects.all()
+        if not getattr(request.user, 'is_super_admin', False):
+            # Hotel users may only import into their own hotel's rooms
+            rooms = rooms.filter(hotel=request.user.hotel) if request.user.hotel_id else rooms.none()
+
+        upload = request.FILES.get('file')
+        if upload:
+            lines = (line.decode('utf-8-sig') for line in upload)
+            rows = csv_rows(lines)
+        else:
+            bookings = request.data.get('bookings') if isinstance(request.data, dict) else None
+            if not isinstance(bookings, list) or not bookings:
+                return Response({'detail': 'Upload a CSV file or send bookings as a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(bookings) > self.max_json_rows:
+                return Response({'detail': f'At most {self.max_json_rows} bookings can be sent as JSON; upload a CSV instead.'}, status=status.HTTP_400_BAD_REQUEST)
+            # JSON rows are numbered from 1
+            rows = ((number, row if isinstance(row, dict) else {}) for number, row in enumerate(bookings, start=1))
+        try:
+            result = import_bookings(rows, rooms=rooms)
+        except ValueError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        data = {
+            'written': result.written,
+            'error_count': result.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in result.errors],
+            'seconds': round(result.seconds, 3),
+            'rows_per_second': round(result.written / result.seconds) if result.seconds else None,
+        }
+        if result.stopped:
+            # The rows before the unreadable part are written; say how far it got
+            data['detail'] = result.stopped
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+class ExportAPIView(APIView):
+    """Stream bookings or payments as CSV or NDJSON, e.g. /api/exports/bookings.csv
+
+    Filters: `hotel` (id or slug, super admins only), `start_date` and
+    `end_date` (inclusive) and `status` (comma-separated).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, kind, export_format):
+        if kind not in EXPORTS or export_format not in EXPORT_FORMATS:
+            raise Http404
+        dates = {}
+        for name in ('start_date', 'end_date'):
+            value = request.GET.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                dates[name] = None
+            if value and not dates[name]:
+                return Response({'detail': f'Invalid {name}. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        hotels = Hotel.objects.all()
+        if not getattr(request.user, 'is_super_admin', False):
+            # Hotel users may only export their own hotel
+            hotels = hotels.filter(pk=request.user.hotel_id) if request.user.hotel_id else hotels.none()
+        elif request.GET.get('hotel'):
+            hotel = request.GET['hotel']
+            try:
+                hotels = hotels.filter(pk=uuid.UUID(hotel))
+            except ValueError:
+                hotels = hotels.filter(slug=hotel)
+        else:
+            hotels = None
+        statuses = [value for value in request.GET.get('status', '').split(',') if value]
+
+        rows = export_queryset(kind, hotels=hotels, statuses=statuses, **dates)
+        response = StreamingHttpResponse(export_chunks(kind, rows, export_format), content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{export_format}"'
+        return response
+
 class MpesaSTKPushView(APIView):
     permission_classes = [permissions.AllowAny]
 
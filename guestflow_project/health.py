@@ -1,4 +1,4 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
@@ -69,3 +69,34 @@ class APIInfoView(View):
         }
         
         return JsonResponse(api_info, status=200)
+
+
+class MetricsView(View):
+    """Prometheus-style counters for scraping"""
+    
+    def get(self, request):
+        from rentals.cache import search_cache_stats
+        from bookings.lifecycle import TRANSITIONS, sweeper_stats
+        stats = search_cache_stats()
+        sweeper = sweeper_stats()
+        lines = [
+            "# HELP guestflow_room_search_cache_hits_total Room searches served from the result cache",
+            "# TYPE guestflow_room_search_cache_hits_total counter",
+            f"guestflow_room_search_cache_hits_total {stats['hits']}",
+            "# HELP guestflow_room_search_cache_misses_total Room searches computed from the database",
+            "# TYPE guestflow_room_search_cache_misses_total counter",
+            f"guestflow_room_search_cache_misses_total {stats['misses']}",
+            "# HELP guestflow_booking_sweeper_transitions_total Bookings moved by the lifecycle sweeper",
+            "# TYPE guestflow_booking_sweeper_transitions_total counter",
+        ]
+        lines += [
+            f'guestflow_booking_sweeper_transitions_total{{transition="{name}"}} {sweeper[name]}'
+            for name in TRANSITIONS
+        ]
+        if sweeper['last_run'] is not None:
+            lines += [
+                "# HELP guestflow_booking_sweeper_last_run_timestamp_seconds When the lifecycle sweeper last ran",
+                "# TYPE guestflow_booking_sweeper_last_run_timestamp_seconds gauge",
+                f"guestflow_booking_sweeper_last_run_timestamp_seconds {sweeper['last_run']}",
+            ]
+        return HttpResponse("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4")
@@ -2,16 +2,20 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from rentals.views import RoomListAPIView
-from bookings.views import BookingCreateAPIView, MpesaSTKPushView
-from .health import HealthCheckView, APIInfoView
+from rentals.views import RoomListAPIView, RoomSearchAPIView, CheapestStayAPIView, RoomAllocationAPIView, RentalCalendarAPIView
+from bookings.views import MpesaSTKPushView
+from .health import HealthCheckView, APIInfoView, MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health/', HealthCheckView.as_view(), name='health_check'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('api/', APIInfoView.as_view(), name='api_info'),
     path('api/rentals/<slug:slug>/rooms/', RoomListAPIView.as_view()),
-    path('api/bookings/', BookingCreateAPIView.as_view()),
+    path('api/rentals/<slug:slug>/cheapest-stays/', CheapestStayAPIView.as_view(), name='cheapest-stays'),
+    path('api/rentals/<slug:slug>/calendar/', RentalCalendarAPIView.as_view(), name='rental-calendar'),
+    path('api/rentals/<slug:slug>/allocations/', RoomAllocationAPIView.as_view(), name='room-allocations'),
+    path('api/search/', RoomSearchAPIView.as_view(), name='room-search'),
     path('api/mpesa/pay/', MpesaSTKPushView.as_view()),
     path('api/', include('bookings.urls')),
 ]
@@ -1,4 +1,8 @@
+from datetime import timedelta
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
 from django.urls import reverse
 from .models import Room, RoomImage, RoomPricing, RoomAvailability, Rental, RoomFee, RoomTax
@@ -51,6 +55,7 @@ class RoomAdmin(HotelScopedAdmin):
     search_fields = ['name', 'hotel__name', 'rental__title', 'description']
     readonly_fields = ['id', 'created_at', 'updated_at']
     inlines = [RoomImageInline, RoomPricingInline, RoomFeeInline, RoomTaxInline]
+    actions = ['set_daily_prices']
     
     fieldsets = (
         ('Basic Information', {
@@ -115,6 +120,35 @@ class RoomAdmin(HotelScopedAdmin):
             )
     get_availability_badge.short_description = 'Status'
     
+    @admin.action(description='Set daily prices for a date range', permissions=['change'])
+    def set_daily_prices(self, request, queryset):
+        from bookings.forms import DailyPriceRangeForm
+        from bookings.daily_prices import set_daily_prices
+        # The action writes DailyRoomPrice rows, so it needs their permissions too
+        if not request.user.has_perms(['bookings.add_dailyroomprice', 'bookings.change_dailyroomprice']):
+            raise PermissionDenied
+        form = DailyPriceRangeForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            data = form.cleaned_data
+            written = set_daily_prices(
+                queryset,
+                data['start_date'],
+                data['end_date'] + timedelta(days=1),
+                price=data['price'],
+                percent=data['percent'],
+                currency=data['currency'] or None,
+            )
+            self.message_user(request, f"Set {written} daily prices across {queryset.count()} rooms.")
+            return None
+        return TemplateResponse(request, 'admin/rentals/room/set_daily_prices.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Set daily prices',
+            'opts': self.model._meta,
+            'form': form,
+            'rooms': queryset,
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        })
+
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "hotel":
             if not (request.user.is_superuser or getattr(request.user, 'role', None) == 'super_admin'):
@@ -0,0 +1,87 @@
+"""
+Multi-room allocation for a guest party.
+
+Finds the cheapest combinations of available rooms that together fit a party
+of adults and children. A combination fits when:
+
+- every room has at least one adult,
+- the adults fit within the rooms' `adults` capacity,
+- adults plus children fit within the rooms' `max_occupancy`.
+
+Infants share a bed or cot and do not count toward occupancy.
+
+The search is a depth-first branch and bound over rooms sorted by price. A
+branch is cut as soon as it cannot beat the worst combination kept so far, or
+cannot reach the party size with the rooms it has left. A combination that
+already fits is never extended, and combinations with a room they do not
+need are skipped.
+"""
+import heapq
+from itertools import count
+
+MAX_SEARCH_NODES = 50000
+
+
+def allocate_party(candidates, adults, children=0, max_rooms=3, limit=5):
+    """Return up to `limit` cheapest fitting combinations as (total, [room, ...]) pairs
+
+    `candidates` is an iterable of (room, total_price) pairs for rooms that are
+    free for the stay.
+    """
+    guests = adults + children
+    max_rooms = min(max_rooms, adults)
+    if adults < 1 or max_rooms < 1:
+        return []
+    candidates = sorted(candidates, key=lambda candidate: candidate[1])
+    occupancy = [room.max_occupancy for room, _ in candidates]
+    adult_beds = [min(room.adults, room.max_occupancy) for room, _ in candidates]
+
+    # Largest single-room capacities from each position onwards, for pruning
+    best_occupancy_after = occupancy[:] + [0]
+    best_adults_after = adult_beds[:] + [0]
+    for index in range(len(candidates) - 1, -1, -1):
+        best_occupancy_after[index] = max(occupancy[index], best_occupancy_after[index + 1])
+        best_adults_after[index] = max(adult_beds[index], best_adults_after[index + 1])
+
+    def needs_every_room(combination, seats, adult_seats):
+        # True when dropping any single room leaves the party without beds
+        return all(
+            seats - room.max_occupancy < guests or adult_seats - min(room.adults, room.max_occupancy) < adults
+            for room in combination
+        )
+
+    # Max-heap on price (negated) of the best combinations found so far
+    best = []
+    tiebreak = count()
+    nodes = 0
+
+    def search(start, chosen, cost, seats, adult_seats):
+        nonlocal nodes
+        slots = max_rooms - len(chosen)
+        for index in range(start, len(candidates)):
+            nodes += 1
+            if nodes > MAX_SEARCH_NODES:
+                return
+            room, price = candidates[index]
+            total = cost + price
+            if len(best) == limit and total >= -best[0][0]:
+                # Later rooms are no cheaper, so no sibling can do better either
+                return
+            if seats + slots * best_occupancy_after[index] < guests or adult_seats + slots * best_adults_after[index] < adults:
+                return
+            new_seats = seats + occupancy[index]
+            new_adult_seats = adult_seats + adult_beds[index]
+            combination = chosen + [room]
+            if new_seats >= guests and new_adult_seats >= adults:
+                if not needs_every_room(combination, new_seats, new_adult_seats):
+                    continue
+                entry = (-total, next(tiebreak), combination)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                else:
+                    heapq.heapreplace(best, entry)
+            elif slots > 1:
+                search(index + 1, combination, total, new_seats, new_adult_seats)
+
+    search(0, [], 0, 0, 0)
+    return [(-negated, rooms) for negated, _, rooms in sorted(best, key=lambda entry: (-entry[0], entry[1]))]
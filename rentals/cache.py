@@ -0,0 +1,123 @@
+"""
+Result cache for room searches.
+
+Responses are cached per rental and date range. Every key embeds a per-rental
+version number, so invalidating a rental is a single counter bump and leaves
+every other rental's entries untouched. Hit and miss counters are kept in the
+same cache so they can be scraped from /metrics/.
+
+Invalidation also records when each rental and room last changed, which the
+API uses for ETag and Last-Modified headers.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+
+SEARCH_CACHE_TIMEOUT = 60 * 15  # 15 minutes
+HITS_KEY = 'room-search:hits'
+MISSES_KEY = 'room-search:misses'
+
+
+def _version_key(rental_id):
+    return f"room-search:version:{rental_id}"
+
+
+def rental_version(rental_id):
+    """Return the current cache version of a rental"""
+    key = _version_key(rental_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a lost counter never revives stale entries
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _changed_key(kind, pk):
+    return f"room-search:changed:{kind}:{pk}"
+
+
+def changed_at(kind, pk):
+    """Return when a 'rental' or 'room' last changed (epoch seconds)
+
+    Unknown (or evicted) stamps start at the current time.
+    """
+    key = _changed_key(kind, pk)
+    changed = cache.get(key)
+    if changed is None:
+        cache.add(key, time.time(), None)
+        changed = cache.get(key)
+    return changed
+
+
+def touch_rooms(room_ids):
+    """Record that rooms changed now"""
+    now = time.time()
+    cache.set_many({_changed_key('room', room_id): now for room_id in room_ids if room_id}, None)
+
+
+def invalidate_rental(rental_id):
+    """Drop every cached search result of one rental"""
+    if not rental_id:
+        return
+    cache.set(_changed_key('rental', rental_id), time.time(), None)
+    key = _version_key(rental_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def invalidate_rooms(room_ids):
+    """Drop the cached search results of the rentals the given rooms belong to"""
+    from .models import Room
+    touch_rooms(room_ids)
+    rental_ids = Room.objects.filter(id__in=room_ids, rental__isnull=False).values_list('rental_id', flat=True).distinct()
+    for rental_id in rental_ids:
+        invalidate_rental(rental_id)
+
+
+def search_cache_key(rental_id, *parts):
+    """Build the cache key of a search of one rental"""
+    suffix = ':'.join(str(part) for part in parts)
+    return f"room-search:{rental_id}:{rental_version(rental_id)}:{suffix}"
+
+
+def _count(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_search_result(key):
+    """Return a cached search result (or None) and record the hit or miss"""
+    result = cache.get(key)
+    _count(MISSES_KEY if result is None else HITS_KEY)
+    return result
+
+
+def set_search_result(key, result):
+    cache.set(key, result, SEARCH_CACHE_TIMEOUT)
+
+
+def search_cache_stats():
+    """Return the hit/miss counters of the search cache"""
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    return {
+        'hits': counters.get(HITS_KEY, 0),
+        'misses': counters.get(MISSES_KEY, 0),
+    }
+
+
+def make_etag(*parts):
+    """Hash the parts a response depends on into an ETag value"""
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def as_http_date(timestamp):
+    """Return an epoch timestamp as an aware datetime for Last-Modified (whole seconds)"""
+    return datetime.fromtimestamp(int(timestamp), tz=timezone.utc)
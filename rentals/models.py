@@ -197,6 +197,9 @@ class RoomAvailability(models.Model):
         ('maintenance', 'Under Maintenance'),
     ]
     
+    # Statuses that make the room unbookable for the night
+    BLOCKING_STATUSES = ['booked', 'blocked', 'maintenance']
+    
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='availability')
     date = models.DateField(help_text="Date")
     status = models.CharField(max_length=20, choices=AVAILABILITY_STATUS, default='available')
@@ -254,4 +257,43 @@ class RoomTax(models.Model):
     is_inclusive = models.BooleanField(default=False)
     
     def __str__(self):
-        return f"{self.room.name} - {self.name}"
\ No newline at end of file
+        return f"{self.room.name} - {self.name}"
+
+# Signal handlers invalidating cached room searches of the affected rental
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+@receiver(pre_save, sender=Room)
+def remember_stored_rental(sender, instance, **kwargs):
+    """Remember the rental a room belonged to before this save"""
+    instance._stored_rental_id = None
+    if not instance._state.adding:
+        instance._stored_rental_id = Room.objects.filter(pk=instance.pk).values_list('rental_id', flat=True).first()
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_searches(sender, instance, **kwargs):
+    """Drop cached room searches of the rental(s) the room belongs to"""
+    from .cache import invalidate_rental, touch_rooms
+    rental_ids = {instance.rental_id, getattr(instance, '_stored_rental_id', None)}
+    for rental_id in rental_ids:
+        transaction.on_commit(lambda r=rental_id: invalidate_rental(r))
+    room_id = instance.pk
+    transaction.on_commit(lambda: touch_rooms([room_id]))
+
+@receiver(post_save, sender=RoomImage)
+@receiver(post_delete, sender=RoomImage)
+@receiver(post_save, sender=RoomFee)
+@receiver(post_delete, sender=RoomFee)
+@receiver(post_save, sender=RoomTax)
+@receiver(post_delete, sender=RoomTax)
+@receiver(post_save, sender=RoomAvailability)
+@receiver(post_delete, sender=RoomAvailability)
+@receiver(post_save, sender=RoomPricing)
+@receiver(post_delete, sender=RoomPricing)
+def invalidate_room_detail_searches(sender, instance, **kwargs):
+    """Drop cached room searches of the rental whose room changed"""
+    from .cache import invalidate_rooms
+    room_id = instance.room_id
+    transaction.on_commit(lambda: invalidate_rooms([room_id]))
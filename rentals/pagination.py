@@ -0,0 +1,5 @@
+from rest_framework.pagination import CursorPagination
+
+class RoomCursorPagination(CursorPagination):
+    """Cursor pagination over rooms, ordered by name with the id as a tie-breaker"""
+    ordering = ('name', 'id')
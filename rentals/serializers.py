@@ -45,6 +45,11 @@ class RoomSerializer(serializers.ModelSerializer):
         model = Room
         fields = ['id', 'name', 'description', 'base_price', 'max_occupancy', 'images', 'total_price', 'nights', 'amenities', 'fees', 'taxes', 'rental_slug']  # Replaced 'capacity' with 'max_occupancy'
     
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load the rental, images, fees and taxes up front so serializing costs a fixed number of queries"""
+        return queryset.select_related('rental').prefetch_related('images', 'fees', 'taxes')
+    
     def get_images(self, obj):
         request = self.context.get('request')
         images = obj.images.all()
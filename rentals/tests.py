@@ -0,0 +1,149 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from bookings import exchange
+from bookings.models import DailyRoomPrice, ExchangeRate
+from bookings.tests import book, make_rental
+from .allocation import allocate_party
+from .models import RoomFee, RoomImage, RoomTax
+from .views import stay_charges
+
+
+class EndpointQueryBudgetTests(TestCase):
+    """Listing endpoints run a fixed number of queries on a cold cache, however many rooms they list
+
+    A budget only moves when a query is added or removed on purpose.
+    """
+    ROOM_LIST_BUDGET = 15
+    ROOM_LIST_WITHOUT_DATES_BUDGET = 7
+    SEARCH_BUDGET = 13
+    SEARCH_WITHOUT_DATES_BUDGET = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.check_in = timezone.localdate() + timedelta(days=10)
+        cls.check_out = cls.check_in + timedelta(days=3)
+        cls.small, cls.small_rooms = make_rental('small', 3)
+        cls.large, cls.large_rooms = make_rental('large', 30)
+        for rooms in (cls.small_rooms, cls.large_rooms):
+            for room in rooms:
+                RoomImage.objects.create(room=room, image='room_images/front.jpg', is_primary=True)
+                RoomImage.objects.create(room=room, image='room_images/bath.jpg', order=1)
+                RoomFee.objects.create(room=room, name='Cleaning', amount=Decimal('10.00'))
+                RoomTax.objects.create(room=room, name='VAT', rate=Decimal('16.00'))
+            book(rooms[0], cls.check_in, cls.check_out)
+
+    def get(self, path, params, budget):
+        """GET path on a cold search cache, asserting it runs `budget` queries"""
+        cache.clear()
+        # Exchange rates are loaded once per process, not per request
+        exchange.fingerprint()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path, params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(context), budget, '\n'.join(query['sql'] for query in context.captured_queries))
+        return response.json()
+
+    def test_room_list(self):
+        params = {'checkin': self.check_in.isoformat(), 'checkout': self.check_out.isoformat()}
+        for rental, listed in ((self.small, 2), (self.large, 20)):
+            data = self.get(f'/api/rentals/{rental.slug}/rooms/', params, self.ROOM_LIST_BUDGET)
+            self.assertEqual(len(data['results']), listed)
+            self.assertEqual([len(room['images']) for room in data['results']], [2] * listed)
+            self.assertTrue(all(room['fees'] and room['taxes'] and room['total_price'] for room in data['results']))
+
+    def test_room_list_without_dates(self):
+        for rental, listed in ((self.small, 3), (self.large, 20)):
+            data = self.get(f'/api/rentals/{rental.slug}/rooms/', {}, self.ROOM_LIST_WITHOUT_DATES_BUDGET)
+            self.assertEqual(len(data['results']), listed)
+            self.assertEqual({room['rental_slug'] for room in data['results']}, {rental.slug})
+
+    def test_search(self):
+        params = {'checkin': self.check_in.isoformat(), 'checkout': self.check_out.isoformat()}
+        data = self.get('/api/search/', dict(params, max_price='102'), self.SEARCH_BUDGET)
+        self.assertEqual(len(data['results']), 4)
+        data = self.get('/api/search/', params, self.SEARCH_BUDGET)
+        self.assertEqual(len(data['results']), 20)
+        self.assertTrue(all(room['hotel']['city'] == 'Nairobi' for room in data['results']))
+
+    def test_search_without_dates(self):
+        data = self.get('/api/search/', {'max_price': '102'}, self.SEARCH_WITHOUT_DATES_BUDGET)
+        self.assertEqual(len(data['results']), 6)
+        data = self.get('/api/search/', {}, self.SEARCH_WITHOUT_DATES_BUDGET)
+        self.assertEqual(len(data['results']), 20)
+        data = self.get('/api/search/', {'city': 'NAIROBI', 'country': 'kenya', 'max_price': '102'}, self.SEARCH_WITHOUT_DATES_BUDGET)
+        self.assertEqual(len(data['results']), 6)
+
+    def test_search_rejects_negative_party(self):
+        for name in ('adults', 'children'):
+            response = self.client.get('/api/search/', {name: '-5'}, secure=True)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['detail'], f'{name} cannot be negative.')
+
+
+class RoomListExchangeRateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.check_in = timezone.localdate() + timedelta(days=10)
+        cls.rental, cls.rooms = make_rental('kes', 1)
+        cls.rate = ExchangeRate.objects.create(from_currency='KES', to_currency='USD', rate=Decimal('100'))
+        for night in range(2):
+            DailyRoomPrice.objects.create(room=cls.rooms[0], date=cls.check_in + timedelta(days=night), price=Decimal('10000'), currency='KES')
+
+    def test_rate_change_reprices_cached_results(self):
+        cache.clear()
+        exchange.invalidate()
+        path = f'/api/rentals/{self.rental.slug}/rooms/'
+        params = {'checkin': self.check_in.isoformat(), 'checkout': (self.check_in + timedelta(days=2)).isoformat()}
+        response = self.client.get(path, params, secure=True)
+        self.assertEqual(response.json()['results'][0]['total_price'], 200.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rate.rate = Decimal('50')
+            self.rate.save()
+        repriced = self.client.get(path, params, secure=True)
+        self.assertEqual(repriced.json()['results'][0]['total_price'], 400.0)
+        self.assertNotEqual(repriced['ETag'], response['ETag'])
+
+
+class RoomAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.check_in = timezone.localdate() + timedelta(days=10)
+        cls.rental, cls.rooms = make_rental('party', 3)
+        for room in cls.rooms:
+            RoomTax.objects.create(room=room, name='VAT', rate=Decimal('16.00'))
+        cls.path = f'/api/rentals/{cls.rental.slug}/allocations/'
+        cls.params = {'checkin': cls.check_in.isoformat(), 'checkout': (cls.check_in + timedelta(days=3)).isoformat()}
+
+    def test_invalid_parameter_is_named(self):
+        for name, value, detail in (
+            ('adults', '0', 'adults must be at least 1.'),
+            ('children', '-1', 'children cannot be negative.'),
+            ('infants', '-2', 'infants cannot be negative.'),
+            ('max_rooms', '0', 'max_rooms must be at least 1.'),
+            ('limit', '0', 'limit must be at least 1.'),
+            ('limit', 'two', 'limit must be a whole number.'),
+        ):
+            response = self.client.get(self.path, dict(self.params, **{name: value}), secure=True)
+            self.assertEqual(response.status_code, 400, name)
+            self.assertEqual(response.json()['detail'], detail)
+
+    def test_ranks_on_decimal_totals(self):
+        with mock.patch('rentals.views.allocate_party', wraps=allocate_party) as allocate:
+            response = self.client.get(self.path, dict(self.params, adults='3'), secure=True)
+        self.assertEqual(response.status_code, 200)
+        candidates = list(allocate.call_args.args[0])
+        self.assertEqual(len(candidates), 3)
+        _, charges = stay_charges(self.rooms, self.check_in, self.check_in + timedelta(days=3))
+        # The exact Charges totals, not a float round trip of them
+        self.assertEqual([str(total) for _, total in candidates], [str(charges[room.id].total) for room in self.rooms])
+        cheapest = response.json()['combinations'][0]
+        self.assertEqual([room['name'] for room in cheapest['rooms']], ['Room 00', 'Room 01'])
+        self.assertEqual(Decimal(str(cheapest['total_price'])), candidates[0][1] + candidates[1][1])
@@ -1,64 +1,355 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from .models import Rental, Room
 from .serializers import RoomSerializer
-from bookings.models import Booking, DailyRoomPrice
+from .cache import search_cache_key, get_search_result, set_search_result, rental_version, changed_at, make_etag, as_http_date
+from .pagination import RoomCursorPagination
+from .allocation import allocate_party
+from bookings.availability import unavailable_room_ids, blocked_night_matrix
+from bookings.pricing import nightly_prices, stored_rates, from_cents, total_price as total_stay_price
+from bookings import exchange
+from bookings.flexible import cheapest_stays
+from bookings.charges import room_charges
 from datetime import datetime, timedelta
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from rest_framework.permissions import AllowAny
 
+def parse_stay_dates(request):
+    """Return (checkin, checkout, error_response) from the checkin/checkout query params"""
+    checkin = request.GET.get('checkin')
+    checkout = request.GET.get('checkout')
+    if not checkin or not checkout:
+        return None, None, None
+    try:
+        checkin_date = datetime.strptime(checkin, "%Y-%m-%d").date()
+        checkout_date = datetime.strptime(checkout, "%Y-%m-%d").date()
+    except ValueError:
+        return None, None, Response({'detail': 'Invalid date format. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+    if checkin_date >= checkout_date:
+        return None, None, Response({'detail': 'Checkout must be after checkin.'}, status=status.HTTP_400_BAD_REQUEST)
+    return checkin_date, checkout_date, None
+
+def stay_charges(rooms, checkin_date, checkout_date):
+    """Return the nightly prices and the Charges of a stay in each room, both keyed by room id"""
+    prices = nightly_prices(rooms, checkin_date, checkout_date)
+    return prices, room_charges(rooms, {room.id: total_stay_price(prices[room.id]) for room in rooms})
+
+def quote_rooms(rooms, checkin_date, checkout_date, request, quote=None):
+    """Serialize available rooms with the total price of the stay, fees and taxes included
+
+    `quote` is the stay_charges() of the rooms when the caller already has it.
+    """
+    quoted = []
+    nights = (checkout_date - checkin_date).days
+    prices, charges = quote or stay_charges(rooms, checkin_date, checkout_date)
+    for room in rooms:
+        price_breakdown = [{'date': str(night.date), 'price': float(night.price)} for night in prices[room.id]]
+        room_charge = charges[room.id]
+        # Serialize the room
+        room_data = RoomSerializer(room, context={'request': request}).data
+        # Only override/add fields not handled by the serializer
+        room_data['total_price'] = float(room_charge.total)
+        room_data['nights'] = nights
+        room_data['price_breakdown'] = price_breakdown
+        room_data['subtotal'] = float(room_charge.subtotal)
+        room_data['fee_amount'] = float(room_charge.fee_amount)
+        room_data['tax_amount'] = float(room_charge.tax_amount)
+        room_data['charges'] = room_charge.breakdown()
+        quoted.append(room_data)
+    return quoted
+
+def _rental_id(slug):
+    return Rental.objects.filter(slug=slug).values_list('id', flat=True).first()
+
+def room_list_etag(request, slug):
+    """ETag of a rental's room list: the rental's cache version, the query and the exchange rates"""
+    rental_id = _rental_id(slug)
+    if rental_id is None:
+        return None
+    return make_etag(rental_version(rental_id), sorted(request.GET.lists()), exchange.fingerprint())
+
+def room_list_last_modified(request, slug):
+    rental_id = _rental_id(slug)
+    if rental_id is None:
+        return None
+    return as_http_date(max(changed_at('rental', rental_id), exchange.changed_at()))
+
 class RoomListAPIView(APIView):
     permission_classes = [AllowAny]
+    pagination_class = RoomCursorPagination
+
+    # Answers If-None-Match/If-Modified-Since with 304 before any pricing runs
+    @method_decorator(condition(etag_func=room_list_etag, last_modified_func=room_list_last_modified))
     def get(self, request, slug):
-        checkin = request.GET.get('checkin')
-        checkout = request.GET.get('checkout')
         rental = get_object_or_404(Rental, slug=slug)
-        rooms = rental.rooms.all()
-        # If no dates provided, return all rooms
-        if not checkin or not checkout:
-            serializer = RoomSerializer(rooms, many=True, context={'request': request})
-            return Response(serializer.data)
+        checkin_date, checkout_date, error = parse_stay_dates(request)
+        if error:
+            return error
+        streaming = bool(request.GET.get('stream'))
+        if not streaming:
+            # Prices in other currencies are converted in the quote, so the rates are part of the key
+            cache_key = search_cache_key(rental.id, checkin_date, checkout_date, request.GET.get('cursor', ''), exchange.fingerprint())
+            cached = get_search_result(cache_key)
+            if cached is not None:
+                return Response(cached)
+
+        # Without dates every room of the rental is listed
+        rooms = RoomSerializer.setup_eager_loading(rental.rooms.all())
+        if checkin_date:
+            # One availability lookup for the whole rental instead of one per room
+            taken = unavailable_room_ids(rental.rooms.values_list('id', flat=True), checkin_date, checkout_date)
+            rooms = rooms.exclude(id__in=taken)
+        if streaming:
+            return self.stream(rooms, checkin_date, checkout_date, request)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rooms, request, view=self)
+        response = paginator.get_paginated_response(self.serialize(page, checkin_date, checkout_date, request))
+        set_search_result(cache_key, response.data)
+        return response
+
+    def serialize(self, rooms, checkin_date, checkout_date, request):
+        if checkin_date:
+            return quote_rooms(rooms, checkin_date, checkout_date, request)
+        return RoomSerializer(rooms, many=True, context={'request': request}).data
+
+    def stream(self, rooms, checkin_date, checkout_date, request):
+        """Stream rooms as newline-delimited JSON, one page-sized chunk at a time"""
+        chunk_size = api_settings.PAGE_SIZE or 20
+        encoder = JSONEncoder()
+
+        def lines():
+            chunk = []
+            for room in rooms.order_by(*self.pagination_class.ordering).iterator(chunk_size=chunk_size):
+                chunk.append(room)
+                if len(chunk) == chunk_size:
+                    for room_data in self.serialize(chunk, checkin_date, checkout_date, request):
+                        yield encoder.encode(room_data) + '\n'
+                    chunk = []
+            for room_data in self.serialize(chunk, checkin_date, checkout_date, request):
+                yield encoder.encode(room_data) + '\n'
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+class RoomSearchAPIView(APIView):
+    """Search available rooms across every active property in one paginated response
+
+    min_price and max_price bound a room's nightly base_price, so they can use
+    its index. They do not bound the quoted total_price of a stay, which adds
+    date-specific rates, fees and taxes.
+    """
+    permission_classes = [AllowAny]
+    pagination_class = api_settings.DEFAULT_PAGINATION_CLASS
+
+    def get(self, request):
+        checkin_date, checkout_date, error = parse_stay_dates(request)
+        if error:
+            return error
         try:
-            checkin_date = datetime.strptime(checkin, "%Y-%m-%d").date()
-            checkout_date = datetime.strptime(checkout, "%Y-%m-%d").date()
+            adults = int(request.GET.get('adults', 0))
+            children = int(request.GET.get('children', 0))
+            min_price = request.GET.get('min_price')
+            min_price = Decimal(min_price) if min_price else None
+            max_price = request.GET.get('max_price')
+            max_price = Decimal(max_price) if max_price else None
+        except (ValueError, InvalidOperation):
+            return Response({'detail': 'adults, children, min_price and max_price must be numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+        for name, count in (('adults', adults), ('children', children)):
+            if count < 0:
+                return Response({'detail': f'{name} cannot be negative.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rooms = RoomSerializer.setup_eager_loading(Room.objects.filter(
+            Q(rental__isnull=True) | Q(rental__is_available=True),
+            is_active=True,
+            hotel__is_active=True,
+        )).select_related('hotel')
+        city = request.GET.get('city')
+        if city:
+            rooms = rooms.filter(hotel__city__iexact=city)
+        country = request.GET.get('country')
+        if country:
+            rooms = rooms.filter(hotel__country__iexact=country)
+        room_type = request.GET.get('room_type')
+        if room_type:
+            rooms = rooms.filter(room_type=room_type)
+        if min_price is not None:
+            rooms = rooms.filter(base_price__gte=min_price)
+        if max_price is not None:
+            rooms = rooms.filter(base_price__lte=max_price)
+        if adults or children:
+            rooms = rooms.filter(max_occupancy__gte=adults + children)
+        if checkin_date:
+            taken = unavailable_room_ids(rooms.values_list('id', flat=True), checkin_date, checkout_date)
+            rooms = rooms.exclude(id__in=taken)
+        rooms = rooms.order_by('base_price', 'name', 'id')
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(rooms, request, view=self)
+        if checkin_date:
+            results = quote_rooms(page, checkin_date, checkout_date, request)
+        else:
+            results = RoomSerializer(page, many=True, context={'request': request}).data
+        for room, room_data in zip(page, results):
+            room_data['hotel'] = {
+                'name': room.hotel.name,
+                'slug': room.hotel.slug,
+                'city': room.hotel.city,
+                'country': room.hotel.country,
+            }
+        return paginator.get_paginated_response(results)
+
+
+class CheapestStayAPIView(APIView):
+    """Cheapest check-in dates for a stay of N nights anywhere inside a date window"""
+    permission_classes = [AllowAny]
+    max_window_days = 366
+    max_limit = 10
+
+    def get(self, request, slug):
+        rental = get_object_or_404(Rental, slug=slug)
+        try:
+            start = datetime.strptime(request.GET.get('start', ''), "%Y-%m-%d").date()
+            end = datetime.strptime(request.GET.get('end', ''), "%Y-%m-%d").date()
+        except ValueError:
+            return Response({'detail': 'start and end are required. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            nights = int(request.GET.get('nights', ''))
+            limit = min(int(request.GET.get('limit', 3)), self.max_limit)
+        except ValueError:
+            return Response({'detail': 'nights and limit must be whole numbers.'}, status=status.HTTP_400_BAD_REQUEST)
+        if nights < 1 or limit < 1:
+            return Response({'detail': 'nights and limit must be at least 1.'}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({'detail': 'end must be after start.'}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days > self.max_window_days:
+            return Response({'detail': f'The window can be at most {self.max_window_days} days.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rooms = rental.rooms.filter(is_active=True)
+        results = []
+        for result in cheapest_stays(rooms, start, end, nights, limit):
+            room = result['room']
+            results.append({
+                'room_id': str(room.id),
+                'name': room.name,
+                'max_occupancy': room.max_occupancy,
+                'stays': [
+                    {
+                        'checkin': str(stay['checkin']),
+                        'checkout': str(stay['checkout']),
+                        'nights': nights,
+                        'total_price': float(stay['total_price']),
+                    }
+                    for stay in result['stays']
+                ],
+            })
+        return Response(results)
+
+
+class RoomAllocationAPIView(APIView):
+    """Cheapest combinations of available rooms that fit a guest party"""
+    permission_classes = [AllowAny]
+    max_rooms = 5
+    max_limit = 20
+
+    def get(self, request, slug):
+        rental = get_object_or_404(Rental, slug=slug)
+        checkin_date, checkout_date, error = parse_stay_dates(request)
+        if error:
+            return error
+        if not checkin_date:
+            return Response({'detail': 'checkin and checkout are required.'}, status=status.HTTP_400_BAD_REQUEST)
+        # Each parameter with its default and smallest allowed value
+        params = {'adults': (1, 1), 'children': (0, 0), 'infants': (0, 0), 'max_rooms': (3, 1), 'limit': (5, 1)}
+        values = {}
+        for name, (default, minimum) in params.items():
+            try:
+                values[name] = int(request.GET.get(name, default))
+            except ValueError:
+                return Response({'detail': f'{name} must be a whole number.'}, status=status.HTTP_400_BAD_REQUEST)
+            if values[name] < minimum:
+                detail = f'{name} cannot be negative.' if minimum == 0 else f'{name} must be at least {minimum}.'
+                return Response({'detail': detail}, status=status.HTTP_400_BAD_REQUEST)
+        adults, children, infants = values['adults'], values['children'], values['infants']
+        max_rooms = min(values['max_rooms'], self.max_rooms)
+        limit = min(values['limit'], self.max_limit)
+
+        rooms = RoomSerializer.setup_eager_loading(rental.rooms.filter(is_active=True))
+        taken = unavailable_room_ids(rental.rooms.values_list('id', flat=True), checkin_date, checkout_date)
+        rooms = [room for room in rooms if room.id not in taken]
+        quote = stay_charges(rooms, checkin_date, checkout_date)
+        quoted = {room.id: room_data for room, room_data in zip(rooms, quote_rooms(rooms, checkin_date, checkout_date, request, quote))}
+        # Ranked on the exact Decimal totals, not the floats of the response
+        candidates = [(room, quote[1][room.id].total) for room in rooms]
+
+        combinations = []
+        for total, chosen in allocate_party(candidates, adults, children, max_rooms=max_rooms, limit=limit):
+            combinations.append({
+                'total_price': float(total),
+                'room_count': len(chosen),
+                'capacity': sum(room.max_occupancy for room in chosen),
+                'rooms': [quoted[room.id] for room in chosen],
+            })
+        return Response({
+            'party': {'adults': adults, 'children': children, 'infants': infants},
+            'nights': (checkout_date - checkin_date).days,
+            'combinations': combinations,
+        })
+
+
+class RentalCalendarAPIView(APIView):
+    """Nightly prices and availability of every room of a rental, in columns
+
+    One `dates` array is shared by all rooms; each room carries a `prices`
+    and an `available` array aligned with it. `end` is exclusive.
+    """
+    permission_classes = [AllowAny]
+    max_range_days = 186
+
+    def get(self, request, slug):
+        rental = get_object_or_404(Rental, slug=slug)
+        try:
+            start = datetime.strptime(request.GET.get('start', ''), "%Y-%m-%d").date()
+            end = datetime.strptime(request.GET.get('end', ''), "%Y-%m-%d").date()
         except ValueError:
-            return Response({'detail': 'Invalid date format. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
-        if checkin_date >= checkout_date:
-            return Response({'detail': 'Checkout must be after checkin.'}, status=status.HTTP_400_BAD_REQUEST)
-        available_rooms = []
-        for room in rooms:
-            overlapping = Booking.objects.filter(
-                room=room,
-                check_in_date__lt=checkout_date,
-                check_out_date__gt=checkin_date,
-                status__in=['pending', 'paid']
-            ).exists()
-            if not overlapping:
-                total_price = Decimal('0.00')
-                nights = (checkout_date - checkin_date).days
-                price_breakdown = []
-                for i in range(nights):
-                    day = checkin_date + timedelta(days=i)
-                    daily_price_obj = DailyRoomPrice.objects.filter(room=room, date=day).first()
-                    if daily_price_obj:
-                        total_price += daily_price_obj.price
-                        price_breakdown.append({'date': str(day), 'price': float(daily_price_obj.price)})
-                    else:
-                        total_price += room.base_price
-                        price_breakdown.append({'date': str(day), 'price': float(room.base_price)})
-                # Add fees and taxes using Decimal
-                fees = list(room.fees.values('name', 'amount'))
-                taxes = list(room.taxes.values('name', 'rate'))
-                fees_total = sum(Decimal(str(f['amount'])) for f in fees)
-                taxes_total = sum(Decimal(str(t['rate'])) for t in taxes)
-                total_amount = total_price + fees_total + taxes_total
-                # Serialize the room
-                room_data = RoomSerializer(room, context={'request': request}).data
-                # Only override/add fields not handled by the serializer
-                room_data['total_price'] = float(total_amount)
-                room_data['nights'] = nights
-                room_data['price_breakdown'] = price_breakdown
-                available_rooms.append(room_data)
-        return Response(available_rooms)
\ No newline at end of file
+            return Response({'detail': 'start and end are required. Use YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({'detail': 'end must be after start.'}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days > self.max_range_days:
+            return Response({'detail': f'The range can be at most {self.max_range_days} days.'}, status=status.HTTP_400_BAD_REQUEST)
+        currency = request.GET.get('currency', '').upper() or None
+
+        rooms = list(rental.rooms.filter(is_active=True).order_by('name', 'id'))
+        rates = stored_rates(rooms, start, end)
+        taken = blocked_night_matrix([room.id for room in rooms], start, end)
+
+        columns = []
+        for index, room in enumerate(rooms):
+            cents = rates[room.id].amounts
+            room_currency = room.currency
+            if currency:
+                try:
+                    cents = exchange.convert_cents(cents, room.currency, currency)
+                except exchange.MissingExchangeRate:
+                    return Response({'detail': f'No exchange rate from {room.currency} to {currency}.'}, status=status.HTTP_400_BAD_REQUEST)
+                room_currency = currency
+            columns.append({
+                'id': str(room.id),
+                'name': room.name,
+                'currency': room_currency,
+                'prices': [float(from_cents(amount)) for amount in cents],
+                'available': (~taken[index]).tolist(),
+            })
+        return Response({
+            'start': str(start),
+            'end': str(end),
+            'dates': [str(start + timedelta(days=offset)) for offset in range((end - start).days)],
+            'rooms': columns,
+        })
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:51
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_hotel_booking_com_url_hotel_custom_domain_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(django.db.models.functions.text.Upper('city'), django.db.models.functions.text.Upper('country'), name='hotel_upper_city_country_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(django.db.models.functions.text.Upper('country'), name='hotel_upper_country_idx'),
+        ),
+    ]
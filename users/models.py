@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.db.models.functions import Upper
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
 from django.urls import reverse
@@ -164,6 +165,9 @@ class Hotel(models.Model):
         verbose_name_plural = 'Hotels/Properties'
         indexes = [
             models.Index(fields=['city', 'country']),
+            # Case-insensitive city/country searches (iexact compares UPPER() values)
+            models.Index(Upper('city'), Upper('country'), name='hotel_upper_city_country_idx'),
+            models.Index(Upper('country'), name='hotel_upper_country_idx'),
             models.Index(fields=['property_type', 'is_active']),
             models.Index(fields=['rating']),
         ]